@@ -30,6 +30,8 @@ history to Population as well, though.
 import numpy as np
 import re
 
+from cocopf.growarray import GrowingArray
+
 
 class PopulationCredit(object):
     """
@@ -41,7 +43,9 @@ class PopulationCredit(object):
 
     The accrual_method works on individual population members,
     accepting current credit, n number of iterations and newly
-    added credit, and returning new credit for n+1.
+    added credit, and returning new credit for n+1.  If it also
+    has an accrue() method, that is used to process all stepped
+    members at once, with array arguments (see CreditAccrualLatest).
     If accrual_method is a name ending with 'r', the 'r' is
     interpreted as reset_on_restart = True.
 
@@ -56,8 +60,10 @@ class PopulationCredit(object):
         self.pop = pop
         self.reset_on_restart = reset_on_restart
 
-        self.credit = np.zeros(self.pop.K) + 1
-        self.iters = self.pop.iters.copy()
+        # credit and iters are views of growable storage, like in Population
+        self._credit = GrowingArray(np.zeros(self.pop.K) + 1)
+        self._iters = GrowingArray(self.pop.iters.copy())
+        self._views_update()
 
         if not callable(accrual_method) and accrual_method.endswith("r"):
             accrual_method = accrual_method[:-1]
@@ -101,8 +107,25 @@ class PopulationCredit(object):
         """
         Add another population member.
         """
-        self.credit = np.append(self.credit, [1], axis = 0)
-        self.iters = np.append(self.iters, [0], axis = 0)
+        self._credit.append(1)
+        self._iters.append(0)
+        self._views_update()
+
+    def compact(self, keep):
+        """
+        Drop credit of removed population members, following
+        pop.compact(); pass the mask it returned.
+        """
+        self._credit.compact(keep)
+        self._iters.compact(keep)
+        self._views_update()
+        if hasattr(self.accrual_method, 'compact'):
+            # Accrual methods with per-member history
+            self.accrual_method.compact(keep)
+
+    def _views_update(self):
+        self.credit = self._credit.view
+        self.iters = self._iters.view
 
     def update(self):
         """
@@ -113,16 +136,25 @@ class PopulationCredit(object):
         self.pop.values[np.isnan(self.pop.values)] = 1e9
         new_credit = self.assign_method(self.pop)
 
-        for i in range(self.pop.K):
-            if self.pop.iters[i] == self.iters[i]:
-                continue
-            if self.pop.iters[i] < self.iters[i] and self.reset_on_restart:
-                self.iters[i] = 0
-            if self.iters[i] > 0:
-                self.credit[i] = self.accrual_method(i, self.credit[i], self.iters[i], new_credit[i])
-            else:
-                self.credit[i] = new_credit[i]
-            self.iters[i] += 1
+        stepped = self.pop.iters != self.iters
+        if self.reset_on_restart:
+            self.iters[stepped & (self.pop.iters < self.iters)] = 0
+        accrued = stepped & (self.iters > 0)
+        idx = np.nonzero(accrued)[0]
+        if len(idx) > 0:
+            self.credit[idx] = self._accrue(idx, self.credit[idx], self.iters[idx], new_credit[idx])
+        fresh = stepped & ~accrued
+        self.credit[fresh] = new_credit[fresh]
+        self.iters[stepped] += 1
+
+    def _accrue(self, idx, credit_old, iters, credit_new):
+        try:
+            accrue = self.accrual_method.accrue
+        except AttributeError:
+            # A plain callable, call it per member
+            return np.array([self.accrual_method(idx[j], credit_old[j], iters[j], credit_new[j])
+                             for j in range(len(idx))])
+        return accrue(idx, credit_old, iters, credit_new)
 
 
 class CreditAssignRaw(object):
@@ -146,8 +178,7 @@ class CreditAssignRanked(object):
     def __call__(self, pop):
         idx = np.argsort(pop.values)
         credit = np.zeros(pop.K)
-        for i in range(pop.K):
-            credit[idx[i]] = i/(pop.K-1.0)
+        credit[idx] = np.arange(pop.K) / (pop.K-1.0)
         return credit
 
 
@@ -155,11 +186,17 @@ class CreditAccrualLatest(object):
     """
     The most naive credit accrual method is to consider just the latest
     optimization result, with no history.
+
+    Like all the accrual classes below, besides the per-member
+    __call__(), it provides accrue() that takes arrays of member indices
+    and their respective credits and iterations.
     """
     def __init__(self):
         pass
     def __call__(self, i, credit_old, iters, credit_new):
         return credit_new
+    def accrue(self, idx, credit_old, iters, credit_new):
+        return credit_new
 
 class CreditAccrualAverage(object):
     """
@@ -170,6 +207,8 @@ class CreditAccrualAverage(object):
         pass
     def __call__(self, i, credit_old, iters, credit_new):
         return credit_old + (credit_new - credit_old) / iters
+    def accrue(self, idx, credit_old, iters, credit_new):
+        return credit_old + (credit_new - credit_old) / iters
 
 class CreditAccrualBest(object):
     """
@@ -180,6 +219,8 @@ class CreditAccrualBest(object):
         pass
     def __call__(self, i, credit_old, iters, credit_new):
         return credit_old if credit_old < credit_new else credit_new
+    def accrue(self, idx, credit_old, iters, credit_new):
+        return np.where(credit_old < credit_new, credit_old, credit_new)
 
 class CreditAccrualAdapt(object):
     """
@@ -190,18 +231,50 @@ class CreditAccrualAdapt(object):
         self.alpha = alpha
     def __call__(self, i, credit_old, iters, credit_new):
         return credit_old + (credit_new - credit_old) * self.alpha
+    def accrue(self, idx, credit_old, iters, credit_new):
+        return credit_old + (credit_new - credit_old) * self.alpha
 
 class CreditAccrualBestLast(object):
     """
     A credit accrual method that considers the best value reached
     by this algorithm over the last N iterations, ignoring any
     temporary setbacks.
+
+    The credit history is kept in a (K x N) ring buffer, padded
+    with +inf until N credits of a member are seen.
     """
     def __init__(self, N):
         self.N = N
-        self.credithist = dict()
+        self.credithist = np.zeros((0, N)) + np.inf
+        # Position of the next write in each member's ring
+        self.pos = np.zeros(0, dtype = np.int)
+        # Whether we have seen any credit of each member
+        self.seeded = np.zeros(0, dtype = bool)
+    def _grow(self, K):
+        if K <= len(self.pos):
+            return
+        K = max(K, 2 * len(self.pos))
+        credithist = np.zeros((K, self.N)) + np.inf
+        credithist[:len(self.credithist)] = self.credithist
+        self.credithist = credithist
+        self.pos = np.append(self.pos, np.zeros(K - len(self.pos), dtype = np.int))
+        self.seeded = np.append(self.seeded, np.zeros(K - len(self.seeded), dtype = bool))
+    def _push(self, idx, credit):
+        self.credithist[idx, self.pos[idx]] = credit
+        self.pos[idx] = (self.pos[idx] + 1) % self.N
     def __call__(self, i, credit_old, iters, credit_new):
-        if i not in self.credithist:
-            self.credithist[i] = [credit_old]
-        self.credithist[i].append(credit_new)
-        return min(self.credithist[i][-self.N:])
+        return self.accrue(np.array([i]), np.array([credit_old]), np.array([iters]), np.array([credit_new]))[0]
+    def accrue(self, idx, credit_old, iters, credit_new):
+        idx = np.asarray(idx)
+        self._grow(idx.max() + 1)
+        new = ~self.seeded[idx]
+        if np.any(new):
+            self._push(idx[new], credit_old[new])
+            self.seeded[idx[new]] = True
+        self._push(idx, credit_new)
+        return self.credithist[idx].min(axis = 1)
+    def compact(self, keep):
+        self._grow(len(keep))
+        self.credithist = self.credithist[:len(keep)][keep]
+        self.pos = self.pos[:len(keep)][keep]
+        self.seeded = self.seeded[:len(keep)][keep]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A benchmark of the import time of cocopf modules, i.e. the startup
+# overhead of every pptools/ invocation and experiment worker.  Each
+# MODULE is imported in a fresh interpreter REPEAT times; the best time
+# is reported, both with deferred imports (the default) and with
+# $COCOPF_IMPORT_EAGER set, which imports all dependencies upfront.
+#
+# Usage: bench-import.py [MODULE] [REPEAT]
+#
+# Example: bench-import.py cocopf.pplot,cocopf.pproc 5
+
+import os
+import string
+import subprocess
+import sys
+
+# Time the import in the child so that interpreter startup is excluded
+CHILD = "import sys, time; sys.path.append('.'); t0 = time.time(); import %s; print time.time() - t0"
+
+
+def bench(module, repeat, eager):
+    env = dict(os.environ)
+    if eager:
+        env['COCOPF_IMPORT_EAGER'] = '1'
+    else:
+        env.pop('COCOPF_IMPORT_EAGER', None)
+    times = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', CHILD % module], env=env)
+        times.append(float(out.split()[-1]))
+    return min(times)
+
+
+if __name__ == "__main__":
+    modules = 'cocopf.methods,cocopf.population,cocopf.pproc,cocopf.pplot' if len(sys.argv) <= 1 else sys.argv[1]
+    repeat = 5 if len(sys.argv) <= 2 else int(sys.argv[2])
+
+    print('%-20s %12s %12s' % ('module', 'lazy ms', 'eager ms'))
+    for module in string.split(modules, ','):
+        print('%-20s %12.1f %12.1f' % (module, bench(module, repeat, False) * 1e3,
+                                       bench(module, repeat, True) * 1e3))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A microbenchmark of the per-step overhead of the various cocopf.minstep
+# stepping backends.  Each METHOD is stepped STEPS times on the (cheap)
+# BBOB function f1 in DIM dimensions, restarting it on convergence, with
+# each of the thread, greenlet and asktell backends (where supported).
+#
+# The reported overhead is the wall time per step minus the time the
+# function evaluations themselves would take.
+#
+# Usage: bench-stepping.py [METHOD] [DIM] [STEPS]
+#
+# Example: bench-stepping.py BFGS,Powell,CMA 5 2000
+
+import string
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+sys.path.append('.')
+import fgeneric
+import bbobbenchmarks
+from cocopf.experiment import FInstance
+from cocopf.methods import MinimizeMethod
+from cocopf.minstep import minimize_stepping
+
+
+def evalcost(f, dim, n = 10000):
+    """
+    Determine the time of a single function evaluation.
+    """
+    X = 10. * np.random.rand(n, dim) - 5.
+    t0 = time.time()
+    for x in X:
+        f.evalfun(x)
+    return (time.time() - t0) / n
+
+def bench(fi, method, stepping, steps):
+    """
+    Step the method ``steps`` times, returning (time, evaluations).
+    """
+    f = fi.f
+    mm = MinimizeMethod(method, fi, stepping = stepping)
+    warnings.simplefilter("ignore") # ignore warnings about unused/ignored options
+
+    evals0 = f.evaluations
+    t0 = time.time()
+    ms = minimize_stepping(f.evalfun, 10. * np.random.rand(fi.dim) - 5., mm)
+    for i in range(steps):
+        try:
+            ms.next()
+        except StopIteration:
+            ms = minimize_stepping(f.evalfun, 10. * np.random.rand(fi.dim) - 5., mm)
+    ms.stop()
+    return (time.time() - t0, f.evaluations - evals0)
+
+
+if __name__ == "__main__":
+    methods = 'BFGS,Powell,CMA' if len(sys.argv) <= 1 else sys.argv[1]
+    dim = 5 if len(sys.argv) <= 2 else int(sys.argv[2])
+    steps = 2000 if len(sys.argv) <= 3 else int(sys.argv[3])
+
+    f = fgeneric.LoggingFunction(datapath=tempfile.mkdtemp(prefix='cocopf-bench'),
+                                 algid='bench', comments='stepping microbenchmark')
+    f.setfun(*bbobbenchmarks.instantiate(1, iinstance=1))
+    fi = FInstance(f, dim, 1, 1, 1e12)
+    ecost = evalcost(f, dim)
+
+    print('%-12s %-10s %12s %12s %14s' % ('method', 'stepping', 'us/step', 'evals/step', 'overhead us/step'))
+    for method in string.split(methods, ','):
+        for stepping in ['thread', 'greenlet', 'asktell']:
+            try:
+                (t, evals) = bench(fi, method, stepping, steps)
+            except RuntimeError, e:
+                print('%-12s %-10s (unsupported: %s)' % (method, stepping, e))
+                continue
+            print('%-12s %-10s %12.1f %12.1f %14.1f'
+                  % (method, stepping, t / steps * 1e6, float(evals) / steps,
+                     (t - evals * ecost) / steps * 1e6))
+    f.finalizerun()
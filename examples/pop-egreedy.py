@@ -80,6 +80,14 @@ def minimize_f(fi, K = None, method = None, eps = None, accrual = None):
     return (pop.total_iters, optmethod)
 
 
+def report(result):
+    (n_iters, optmethod) = result
+    comment = ' with %d iterations' % n_iters
+    if optmethod is not None:
+        comment += ' (* %s)' % optmethod
+    return comment
+
+
 if __name__ == "__main__":
     method = sys.argv[1]
     K = 30 if method.count(',') == 0 else method.count(',') + 1
@@ -98,12 +106,4 @@ if __name__ == "__main__":
         shortname = 'pE%dG%d%s_%s' % (int(eps*100), K, accrual if accrual != 'latest' else '', method)
         comments = 'Iterative epsgreedy-sampling %s, eps=%s, pop. K=%d, cr. accrual = %s' % (method, eps, K, accrual)
     e = Experiment(eval(maxfev), shortname, comments)
-
-    for i in e.finstances():
-        (n_iters, optmethod) = minimize_f(i, **m_opts)
-        e.f.finalizerun()
-
-        comment = ' with %d iterations' % n_iters
-        if optmethod is not None:
-            comment += ' (* %s)' % optmethod
-        e.freport(i, comment)
+    e.run(minimize_f, report=report, **m_opts)
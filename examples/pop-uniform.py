@@ -109,6 +109,14 @@ def minimize_f(fi, K = None, method = None):
     return (pop.total_iters, optmethod)
 
 
+def report(result):
+    (n_iters, optmethod) = result
+    comment = ' with %d iterations' % n_iters
+    if optmethod is not None:
+        comment += ' (* %s)' % optmethod
+    return comment
+
+
 if __name__ == "__main__":
     method = sys.argv[1]
     K = 30 if method.count(',') == 0 else method.count(',') + 1
@@ -126,12 +134,4 @@ if __name__ == "__main__":
         shortname = 'pUNIF%d_%s' % (K, method)
         comments = 'Iterative UNIFORM-sampling %s, pop. K=%d' % (method, K)
     e = Experiment(eval(maxfev), shortname, comments)
-
-    for i in e.finstances():
-        (n_iters, optmethod) = minimize_f(i, **m_opts)
-        e.f.finalizerun()
-
-        comment = ' with %d iterations' % n_iters
-        if optmethod is not None:
-            comment += ' (* %s)' % optmethod
-        e.freport(i, comment)
+    e.run(minimize_f, report=report, **m_opts)
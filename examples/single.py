@@ -84,9 +84,14 @@ def minimize_f(fi, method = None, wantrestarts = None):
 
         n_iters = cb.n_iters
 
+    mmdata.close()
     return n_restarts
 
 
+def report(restarts):
+    return ' with %d restarts' % restarts
+
+
 if __name__ == "__main__":
     method = sys.argv[1]
     wantrestarts = 0 if len(sys.argv) <= 2 else eval(sys.argv[2])
@@ -99,8 +104,4 @@ if __name__ == "__main__":
         shortname = '%s' % method
         comments = 'Method %s' % method
     e = Experiment(eval(maxfev), shortname, comments)
-
-    for i in e.finstances():
-        restarts = minimize_f(i, method, wantrestarts)
-        e.f.finalizerun()
-        e.freport(i, ' with %d restarts' % restarts)
+    e.run(minimize_f, report=report, method=method, wantrestarts=wantrestarts)
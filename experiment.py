@@ -10,8 +10,14 @@ This is not even specific to COCOpf. It is inspired by the BBOB
 example experiment.
 """
 
+import collections
+import fcntl
+import json
+import multiprocessing
 import string
 import os
+import re
+import shutil
 import sys
 import time
 import math
@@ -53,6 +59,72 @@ class FInstance:
         except TypeError:
             return out
 
+    def evalfun_batch(self, X):
+        """
+        Like evalfun(), but evaluating a whole batch of points given
+        as rows of the matrix ``X`` in a single vectorized call.
+        Returns an array of function values.
+        """
+        if self.f._is_rowformat:
+            x = np.asarray(X)
+        else:
+            x = np.transpose(X)
+        out = self.f._fun_evalfull(x)
+        if isinstance(out, tuple):
+            out = out[0] # (fvalue, ftrue)
+        return np.atleast_1d(out)
+
+
+class CostDB:
+    """
+    A persistent database of wall time and function evaluations spent
+    on finished tasks, aggregated per (dim, fun_id) for each method
+    (experiment shortname).  It is stored as a JSON file that can be
+    shared by multiple concurrently running experiments.
+    """
+    def __init__(self, filename, method):
+        self.filename = filename
+        self.method = method
+        self.costs = self._load().get(method, {})
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def record(self, dim, fun_id, walltime, evals):
+        """
+        Record the cost of a single finished task.
+        """
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(self.filename + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            db = self._load()
+            costs = db.setdefault(self.method, {})
+            entry = costs.setdefault('%d %d' % (dim, fun_id), [0, 0., 0])
+            entry[0] += 1
+            entry[1] += walltime
+            entry[2] += evals
+            with open(self.filename + '.tmp', 'w') as f:
+                json.dump(db, f)
+            os.rename(self.filename + '.tmp', self.filename)
+            self.costs = costs
+
+    def estimate(self, dim, fun_id):
+        """
+        Return the expected (wall time, evaluations) of a task,
+        or None if we have no data.
+        """
+        try:
+            (count, walltime, evals) = self.costs['%d %d' % (dim, fun_id)]
+        except KeyError:
+            return None
+        return (walltime / count, float(evals) / count)
+
 
 class Experiment:
     def __init__(self, maxfev, shortname, comments):
@@ -71,11 +143,18 @@ class Experiment:
         each n-th function, offset by m. This is useful for speedup by
         parallelized benchmarking, e.g.:
             parallel -u --gnu env BBOB_FUNSTRIPES={1}%6 ./pop-egreedy.py ::: 0 1 2 3 4 5
+        The stripes share the data directory; each of them resumes and
+        rolls back only its own functions' data.
 
         Analogously, the environment variable $BBOB_INSTRIPES can be used
-        to parallelize evaluation of instances.  The recommended way to
-        run experiments is combining both:
+        to parallelize evaluation of instances:
             parallel -u --gnu env BBOB_FUNSTRIPES={1}%6 BBOB_INSTRIPES={2}%5 ./pop-ucb1.py Nelder-Mead,Powell,BFGS,L-BFGS-B,CG,SLSQP,CMA,BIPOP-CMA 8 100000 16.0 yz log,adapt0.7 ::: `seq 0 5` ::: `seq 0 4`
+
+        However, static stripes tend to leave most cores idle at the end
+        when waiting for the slow functions.  The recommended way to run
+        experiments in parallel is the run() method with the $BBOB_WORKERS
+        environment variable set to the number of worker processes, e.g.:
+            env BBOB_WORKERS=30 ./pop-ucb1.py ...
         """
         self.maxfev = maxfev
         strmaxfev = '1e%d' % int(math.log10(maxfev))
@@ -90,10 +169,14 @@ class Experiment:
         dirsuffix = ''
 
         self.function_ids = bbobbenchmarks.nfreeIDs
+        # Function stripes share the data directory; this tags the files
+        # (see _snapshot_name()) that must not be shared among them
+        self.stripe = ''
         funstripes = os.environ.get('BBOB_FUNSTRIPES')
         if funstripes is not None:
             (ofs, tot) = [int(i) for i in funstripes.split('%')]
             self.function_ids = [i for i in self.function_ids if (i-ofs)%tot == 0]
+            self.stripe = 'f%dof%d' % (ofs, tot)
 
         self.instances = range(1, 6) + range(31, 41)
         instripes = os.environ.get('BBOB_INSTRIPES')
@@ -107,35 +190,89 @@ class Experiment:
         np.random.seed(int(self.t0))
 
         comments += ', FEV=%s*dim' % maxfev
-        self.f = fgeneric.LoggingFunction(
-                datapath='data-%s%s/%s%s' % (strmaxfev, fulldim, shortname, dirsuffix),
+        self.comments = comments
+        self.datapath = 'data-%s%s/%s%s' % (strmaxfev, fulldim, shortname, dirsuffix)
+        # Costs are kept outside of the data directory to survive wiping it
+        self.costdb = CostDB('data-%s%s/costs.json' % (strmaxfev, fulldim), shortname)
+        self.f = fgeneric.LoggingFunction(datapath=self.datapath,
                 algid=shortname, comments=comments)
 
+        self._resume()
+
+    def tasks(self):
+        """
+        A list of all (dim, fun_id, iinstance) tasks yet to be evaluated,
+        in the order of decreasing expected cost.
+        """
+        tasks = [(dim, fun_id, iinstance)
+                 for dim in self.dimensions
+                 for fun_id in self.function_ids
+                 for iinstance in self.instances
+                 if (dim, fun_id, iinstance) not in self.done]
+        return sorted(tasks, key=self._task_cost, reverse=True)
+
+    def _task_cost(self, task):
+        """
+        A sort key estimating the cost of a given task.  We use the wall
+        time measured in previous runs; tasks we know nothing about go
+        first, since the budget is linear in dim, evaluation of (rotated)
+        functions is quadratic and the later (multi-modal) functions tend
+        to be the slow ones.
+        """
+        (dim, fun_id, iinstance) = task
+        estimate = self.costdb.estimate(dim, fun_id)
+        if estimate is None:
+            return (True, dim, fun_id)
+        return (False, estimate[0])
+
+    def eta(self, workers=1):
+        """
+        Estimate the wall time (in seconds) needed to evaluate all remaining
+        tasks, based on past costs.  Tasks we know nothing about are assumed
+        to take the average time.  Returns None if no estimates are available.
+        """
+        estimates = [self.costdb.estimate(dim, fun_id) for (dim, fun_id, iinstance) in self.tasks()]
+        known = [e[0] for e in estimates if e is not None]
+        if not known:
+            return None
+        return (sum(known) + np.mean(known) * (len(estimates) - len(known))) / workers
+
+    def finstance(self, task):
+        """
+        Set up and return the FInstance of a given task.
+        """
+        (dim, fun_id, iinstance) = task
+        self.f.setfun(*bbobbenchmarks.instantiate(fun_id, iinstance=iinstance))
+        return FInstance(self.f, dim, fun_id, iinstance, self.maxfev * dim)
+
     def finstances(self):
         """
         An iterator that generates all function instances
-        to be evaluated.
+        to be evaluated, the most expensive ones first.
         """
-        for dim in self.dimensions:
-            maxfunevals = self.maxfev * dim
-            fevs = np.zeros(len(self.function_ids) * len(self.instances))
-            fevs_i = 0
-            for fun_id in self.function_ids:
-                for iinstance in self.instances:
-                    self.f.setfun(*bbobbenchmarks.instantiate(fun_id, iinstance=iinstance))
-                    yield FInstance(self.f, dim, fun_id, iinstance, maxfunevals)
+        tasks = self.tasks()
+        # Tasks to go per dimension and per function, for progress reports
+        dimleft = collections.Counter(dim for (dim, fun_id, iinstance) in tasks)
+        funleft = collections.Counter((dim, fun_id) for (dim, fun_id, iinstance) in tasks)
+        overshoot = dict() # dim -> (max FEV, fun_id, iinstance)
+        for task in tasks:
+            (dim, fun_id, iinstance) = task
+            self._task_begin(self.datapath, task)
+            t = time.time()
+            yield self.finstance(task)
+            self._task_done(self.datapath, task, time.time() - t)
 
-                    fevs[fevs_i] = self.f.evaluations
-                    fevs_i += 1
+            if dim not in overshoot or self.f.evaluations > overshoot[dim][0]:
+                overshoot[dim] = (self.f.evaluations, fun_id, iinstance)
 
-                print '  % -12s      date and time: %s' % (self.shortname, time.asctime())
+            funleft[(dim, fun_id)] -= 1
+            if funleft[(dim, fun_id)] == 0:
+                print '  % -12s      date and time: %s%s' % (self.shortname, time.asctime(), self._eta_str())
 
-            overshoot_idx = np.argmax(fevs)
-            overshoot = fevs[overshoot_idx]
-            overshoot_f = self.function_ids[int(overshoot_idx / len(self.instances))]
-            overshoot_i = self.instances[overshoot_idx % len(self.instances)]
-            print('---- % -12s dimension %d-D done ----  (max FEV: %d/%d in f%d:%d)' %
-                    (self.shortname, dim, overshoot, maxfunevals, overshoot_f, overshoot_i))
+            dimleft[dim] -= 1
+            if dimleft[dim] == 0:
+                print('---- % -12s dimension %d-D done ----  (max FEV: %d/%d in f%d:%d)' %
+                        ((self.shortname, dim, overshoot[dim][0], self.maxfev * dim) + overshoot[dim][1:]))
 
     def freport(self, finstance, note):
         print('  % -12s  f%d in %d-D, instance %d: FEs=%d/%d%s, '
@@ -143,3 +280,262 @@ class Experiment:
               % (self.shortname, finstance.fun_id, finstance.dim, finstance.iinstance,
                  self.f.evaluations, finstance.maxfunevals, note,
                  self.f.fbest - self.f.ftarget, (time.time()-self.t0)/60./60.))
+
+    # Interrupted experiments are resumed by skipping tasks listed in the
+    # completed-task manifest and rolling data files back to their state
+    # at the beginning of the interrupted task, as recorded in a snapshot
+    # of their sizes.
+    #
+    # Concurrent $BBOB_FUNSTRIPES processes share the data directory, so
+    # each stripe has its own snapshot and worker directories and takes
+    # care only of data files of its own functions.
+    MANIFEST = 'completed.manifest'
+    SNAPSHOT_RE = re.compile(r'^begin(-\w+)?\.snapshot(\.tmp)?$')
+    WORKER_RE = re.compile(r'^worker(\d+)(?:-(\w+))?$')
+    FUNCTION_RE = re.compile(r'_f(\d+)[_.]')
+
+    def _snapshot_name(self):
+        if self.stripe:
+            return 'begin-%s.snapshot' % self.stripe
+        return 'begin.snapshot'
+
+    def _owns(self, name):
+        """
+        Whether the data file ``name`` belongs to functions of our stripe.
+        """
+        if not self.stripe:
+            return True
+        m = self.FUNCTION_RE.search(os.path.basename(name))
+        return m is not None and int(m.group(1)) in self.function_ids
+
+    def _worker_dirs(self):
+        """
+        A list of (k, path) of our workers' data directories.
+        """
+        if not os.path.isdir(self.datapath):
+            return []
+        dirs = []
+        for d in sorted(os.listdir(self.datapath)):
+            m = self.WORKER_RE.match(d)
+            if m is not None and (m.group(2) or '') == self.stripe:
+                dirs.append((int(m.group(1)), os.path.join(self.datapath, d)))
+        return dirs
+
+    def _datapaths(self):
+        """
+        All directories with task data: the main one and those
+        of workers left behind by an interrupted run().
+        """
+        return [self.datapath] + [path for (k, path) in self._worker_dirs()]
+
+    def _resume(self):
+        """
+        Load the set of completed tasks and roll back the data
+        of tasks that were interrupted.
+        """
+        self.done = set()
+        for path in self._datapaths():
+            try:
+                with open(os.path.join(path, self.MANIFEST)) as f:
+                    self.done.update(tuple(int(i) for i in line.split()) for line in f)
+            except IOError:
+                pass
+        for path in self._datapaths():
+            self._rollback(path)
+        if self.done:
+            print('  % -12s  resuming, %d tasks already completed' % (self.shortname, len(self.done)))
+
+    def _datafiles(self, path):
+        """
+        A dict of relative paths and sizes of all our data files in ``path``.
+        """
+        sizes = dict()
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            if dirpath == path:
+                dirnames[:] = [d for d in dirnames if not self.WORKER_RE.match(d)]
+            for name in filenames:
+                if dirpath == path and (name == self.MANIFEST or self.SNAPSHOT_RE.match(name)):
+                    continue
+                if not self._owns(name):
+                    continue
+                fullname = os.path.join(dirpath, name)
+                sizes[os.path.relpath(fullname, path)] = os.path.getsize(fullname)
+        return sizes
+
+    def _rollback(self, path):
+        snapshotfile = os.path.join(path, self._snapshot_name())
+        try:
+            with open(snapshotfile) as f:
+                snapshot = json.load(f)
+        except IOError:
+            return
+        task = tuple(snapshot['task'])
+        if task not in self.done:
+            print('  % -12s  rolling back interrupted f%d in %d-D, instance %d'
+                  % (self.shortname, task[1], task[0], task[2]))
+            for (name, size) in self._datafiles(path).iteritems():
+                fullname = os.path.join(path, name)
+                if name not in snapshot['sizes']:
+                    os.remove(fullname)
+                elif size > snapshot['sizes'][name]:
+                    with open(fullname, 'r+b') as f:
+                        f.truncate(snapshot['sizes'][name])
+        _remove_snapshot(snapshotfile)
+
+    def _task_begin(self, path, task):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        snapshotfile = os.path.join(path, self._snapshot_name())
+        with open(snapshotfile + '.tmp', 'w') as f:
+            json.dump(dict(task=task, sizes=self._datafiles(path)), f)
+        os.rename(snapshotfile + '.tmp', snapshotfile)
+
+    def _task_done(self, path, task, walltime):
+        (dim, fun_id, iinstance) = task
+        self.costdb.record(dim, fun_id, walltime, self.f.evaluations)
+        with open(os.path.join(path, self.MANIFEST), 'a') as f:
+            f.write('%d %d %d\n' % task)
+            f.flush()
+            os.fsync(f.fileno())
+        _remove_snapshot(os.path.join(path, self._snapshot_name()))
+        self.done.add(task)
+
+    def run(self, minimize_f, workers=None, report=None, **kwargs):
+        """
+        Evaluate ``minimize_f(finstance, **kwargs)`` on all function
+        instances, finalizing each run and reporting it with a note
+        returned by ``report(result)`` (if given).
+
+        With ``workers`` > 1 (by default, taken from $BBOB_WORKERS),
+        the function instances are dispatched dynamically to a pool
+        of worker processes, the most expensive ones first.  Each worker
+        logs to its own data directory; these are merged to the main
+        data directory at the end.  Note that minimize_f and report
+        must be module-level functions in that case.
+        """
+        if workers is None:
+            workers = int(os.environ.get('BBOB_WORKERS', 1))
+        print('  % -12s  %d tasks to go%s' % (self.shortname, len(self.tasks()), self._eta_str(workers)))
+
+        if workers <= 1:
+            for fi in self.finstances():
+                self._run_finstance(fi, minimize_f, report, kwargs)
+            self._merge_workers()
+            return
+
+        # Worker processes are forked and inherit these
+        self._job = (minimize_f, report, kwargs)
+        pool = multiprocessing.Pool(workers, _worker_init, (self,))
+        try:
+            for task in pool.imap_unordered(_worker_run, self.tasks(), chunksize=1):
+                pass
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        print('---- % -12s all tasks done, merging worker data ----' % (self.shortname))
+        self._merge_workers()
+
+    def _eta_str(self, workers=1):
+        eta = self.eta(workers)
+        return ', ETA [h]: %.2f' % (eta/60./60.) if eta is not None else ''
+
+    def _run_finstance(self, fi, minimize_f, report, kwargs):
+        result = minimize_f(fi, **kwargs)
+        self.f.finalizerun()
+        self.freport(fi, report(result) if report is not None else '')
+
+    def _worker_datapath(self, k):
+        if self.stripe:
+            return os.path.join(self.datapath, 'worker%d-%s' % (k, self.stripe))
+        return os.path.join(self.datapath, 'worker%d' % k)
+
+    def _merge_workers(self):
+        """
+        Merge data of all our workers into the main data directory.
+        """
+        for (k, wpath) in self._worker_dirs():
+            self._merge_worker(k)
+
+    def _merge_worker(self, k):
+        """
+        Merge data of worker ``k`` into the main data directory.
+        The data files are renamed to carry a worker tag and the
+        references in the .info files updated accordingly.
+        """
+        wpath = self._worker_datapath(k)
+        if not os.path.isdir(wpath):
+            return
+
+        try:
+            with open(os.path.join(wpath, self.MANIFEST)) as f:
+                manifest = f.read()
+            with open(os.path.join(self.datapath, self.MANIFEST), 'a') as f:
+                f.write(manifest)
+        except IOError:
+            pass
+
+        # Pick a tag that does not clash with already merged files
+        existing = set()
+        for (dirpath, dirnames, filenames) in os.walk(self.datapath):
+            existing.update(filenames)
+        tag = 'w%d' % k
+        n = 0
+        while any(('_' + tag + '.') in name for name in existing):
+            n += 1
+            tag = 'w%d-%d' % (k, n)
+
+        for (dirpath, dirnames, filenames) in os.walk(wpath):
+            reldir = os.path.relpath(dirpath, wpath)
+            for name in filenames:
+                src = os.path.join(dirpath, name)
+                if reldir == '.' and (name == self.MANIFEST or self.SNAPSHOT_RE.match(name)):
+                    continue
+                elif name.endswith('.info') and reldir == '.':
+                    with open(src) as f:
+                        info = f.read()
+                    info = re.sub(r'(\S+)\.dat\b', r'\1_%s.dat' % tag, info)
+                    with open(os.path.join(self.datapath, name), 'a') as f:
+                        f.write(info)
+                else:
+                    parts = name.split('.', 1)
+                    parts[0] += '_' + tag
+                    dstdir = os.path.join(self.datapath, reldir)
+                    if not os.path.isdir(dstdir):
+                        os.makedirs(dstdir)
+                    shutil.move(src, os.path.join(dstdir, '.'.join(parts)))
+        shutil.rmtree(wpath)
+
+
+def _remove_snapshot(snapshotfile):
+    try:
+        os.remove(snapshotfile)
+    except OSError:
+        pass # already gone, e.g. removed by hand
+
+
+# The Experiment of a worker process of Experiment.run()
+_worker_experiment = None
+
+def _worker_init(experiment):
+    global _worker_experiment
+    k = multiprocessing.current_process()._identity[0]
+    # Make sure the workers do not share the random sequence
+    np.random.seed((int(experiment.t0) + k) % 2**32)
+    experiment.worker = k
+    experiment.f = fgeneric.LoggingFunction(datapath=experiment._worker_datapath(k),
+            algid=experiment.shortname, comments=experiment.comments)
+    _worker_experiment = experiment
+
+def _worker_run(task):
+    e = _worker_experiment
+    (minimize_f, report, kwargs) = e._job
+    path = e._worker_datapath(e.worker)
+    e._task_begin(path, task)
+    t = time.time()
+    e._run_finstance(e.finstance(task), minimize_f, report, kwargs)
+    e._task_done(path, task, time.time() - t)
+    return task
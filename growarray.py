@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A growable NumPy array with amortized O(1) appends, used to store
+per-member data of populations that keep adding members.
+"""
+
+import numpy as np
+
+
+class GrowingArray(object):
+    """
+    A NumPy array that can be appended to in amortized O(1) time,
+    by preallocating capacity that doubles whenever it is exhausted.
+
+    The live data are available as ``view``, which is a plain NumPy array
+    (a view of the underlying buffer) that can be modified in place;
+    note that append() and compact() replace it with a new view.
+
+    >>> a = GrowingArray(np.zeros(3))
+    >>> i = a.append(1.)
+    >>> a.view
+    array([ 0.,  0.,  0.,  1.])
+    """
+    def __init__(self, data):
+        self.buf = np.array(data)
+        self.n = len(self.buf)
+        self.view = self.buf[:self.n]
+
+    def __len__(self):
+        return self.n
+
+    def append(self, row):
+        """
+        Append a single row, returning its index.
+        """
+        if self.n == len(self.buf):
+            buf = np.empty((max(2 * self.n, 4),) + self.buf.shape[1:], dtype=self.buf.dtype)
+            buf[:self.n] = self.buf[:self.n]
+            self.buf = buf
+        self.buf[self.n] = row
+        self.n += 1
+        self.view = self.buf[:self.n]
+        return self.n - 1
+
+    def compact(self, keep):
+        """
+        Drop all rows not selected by the boolean mask ``keep``,
+        preserving the order of the remaining rows.
+        """
+        k = np.count_nonzero(keep)
+        self.buf[:k] = self.view[keep]
+        self.n = k
+        self.view = self.buf[:self.n]
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Deferred module imports.  SciPy, matplotlib and the COCO post-processing
+modules take seconds to import; modules that only need them in some code
+paths refer to them via a LazyModule instead, which performs the import
+on first attribute access.
+
+Set $COCOPF_IMPORT_EAGER to import everything upfront as usual (e.g. to
+catch missing dependencies early).
+"""
+
+import importlib
+import os
+
+
+class LazyModule(object):
+    """
+    A stand-in for module ``name`` that imports it on first attribute
+    access.  ``setup``, if given, is called just before the import.
+
+        so = LazyModule('scipy.optimize')
+        so.basinhopping(...)  # scipy.optimize is imported here
+    """
+    def __init__(self, name, setup=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_setup'] = setup
+        self.__dict__['_module'] = None
+        if os.environ.get('COCOPF_IMPORT_EAGER'):
+            self._load()
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            if self._setup is not None:
+                self._setup()
+            module = importlib.import_module(self._name)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        return '<lazy module %r%s>' % (self._name, '' if self.__dict__['_module'] is None else ' (loaded)')
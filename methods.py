@@ -35,10 +35,19 @@ All in all, these minimization method names are recognized:
       functionality.
 """
 
+import atexit
+import gzip
 import os
+import signal
+import time
+import weakref
 
 import numpy as np
-import scipy.optimize as so
+
+from cocopf.lazy import LazyModule
+
+# Importing scipy.optimize is slow and not needed for e.g. CMA-only runs
+so = LazyModule('scipy.optimize')
 
 
 class MinimizeMethod(object):
@@ -56,7 +65,22 @@ class MinimizeMethod(object):
             a calling convention similar to `scipy.optimize.basinhopping`;
             if that doesn't suit you, provide a wrapper lambda or override
             the ``__call__`` method as well.
-        ``minimizer_kwargs``: The minimizer parameters.
+        ``minimizer_kwargs``: The minimizer parameters.  These may be
+            shared by all methods of the same name and dimension (see
+            `_cached_kwargs`), so replace rather than modify them.
+        ``lazy_kwargs``: A dict of minimizer parameters that depend on
+            the state of the benchmark (like the remaining budget); they
+            map to callables that produce the value when the minimization
+            is started, overriding ``minimizer_kwargs``.
+        ``stepping``: The cocopf.minstep backend used for stepping the
+            method; 'auto' (default), 'thread', 'greenlet' or 'asktell'.
+            'auto' uses 'asktell' if available and 'thread' otherwise.
+        ``asktell``: None, or a callable that returns a fresh minimizer
+            object with an ask/tell interface (like CMAEvolutionStrategy)
+            when called with the initial solution x0.  If available, it
+            is used by the 'asktell' stepping backend.
+        ``vectorized``: Whether the ``asktell`` minimizer should evaluate
+            each generation by a single vectorized objective function call.
 
     Example:
 
@@ -75,7 +99,7 @@ class MinimizeMethod(object):
     and you should plan your experiments to restart it in that case.
     """
 
-    def __init__(self, name, fi):
+    def __init__(self, name, fi, stepping='auto'):
         """
         Initialize the method described by ``name`` for the particular
         FInstance ``fi``.  By default, we set the `outer_loop` to
@@ -83,14 +107,20 @@ class MinimizeMethod(object):
         and set up minimize parameters to perform a bounded search
         between -6.0 and +6.0.
 
+        ``stepping`` selects the cocopf.minstep backend to use.
+
         Method-specific setup is done in `_setup_method`, called at
         the end of the constructor.
         """
         self.name = name
         self.fi = fi
+        self.stepping = stepping
 
-        self.outer_loop = so.basinhopping
+        self.outer_loop = _basinhopping
         self.minimizer_kwargs = dict()
+        self.lazy_kwargs = dict()
+        self.asktell = None
+        self.vectorized = False
 
         self._setup_method(name)
 
@@ -111,67 +141,69 @@ class MinimizeMethod(object):
             self._setup_scipy(name)
 
     def _setup_cma(self, name):
-        import cma
-
-        def cma_wrapper(fun, x0, callback, minimizer_kwargs):
-            class InnerCMACallback:
-                def __init__(self, realcb):
-                    self.realcb = realcb
-
-                def __call__(self, cma):
-                    self.realcb(cma.best.x)
-
-            cb = minimizer_kwargs.pop('callback')
-            minimizer_kwargs['options']['termination_callback'] = InnerCMACallback(cb) if cb is not None else None
-
-            if 'restarts' in minimizer_kwargs:
-                # We ignore passed x0 in case a restart strategy is employed
-                # as it is important to start at a different point in each restart
-                # (esp. in the smallpop stages of BIPOP, obviously).
-                x0 = '10. * np.random.rand(%d) - 5' % minimizer_kwargs.pop('dim')
-
-            try:
-                return cma.fmin(fun, x0, 10./4., **minimizer_kwargs)
-            except cma._Error, e:
-                print "CMA error: " + str(e)
-                return None
-
-        self.outer_loop = cma_wrapper
-
-        self.minimizer_kwargs = dict(
-                options={'ftarget': self.fi.f.ftarget,
-                         'maxfevals': self.fi.maxfunevals - self.fi.f.evaluations,
-                         'verb_disp': 0, 'verb_filenameprefix': '/tmp/outcmaes'}
+        _import_cma()
+        self.outer_loop = _cma_wrapper
+
+        def build():
+            kwargs = dict(options={'verb_disp': 0, 'verb_filenameprefix': '/tmp/outcmaes'})
+            # Possibly set up a restart strategy
+            if name.upper() == 'IPOP-CMA':
+                kwargs['restarts'] = 9
+            elif name.upper() == 'BIPOP-CMA':
+                kwargs['restarts'] = 9
+                kwargs['bipop'] = True
+            if 'restarts' in kwargs:
+                kwargs['dim'] = self.fi.dim
+            return kwargs
+        self.minimizer_kwargs = _cached_kwargs(name.upper(), self.fi.dim, build)
+
+        base_options = self.minimizer_kwargs['options']
+        self.lazy_kwargs = dict(
+                options=lambda: dict(base_options,
+                                     ftarget=self.fi.f.ftarget,
+                                     maxfevals=self.fi.maxfunevals - self.fi.f.evaluations),
             )
 
-        # Possibly set up a restart strategy
-        if name.upper() == 'IPOP-CMA':
-            self.minimizer_kwargs['restarts'] = 9
-        elif name.upper() == 'BIPOP-CMA':
-            self.minimizer_kwargs['restarts'] = 9
-            self.minimizer_kwargs['bipop'] = True
+        if 'restarts' not in self.minimizer_kwargs:
+            # Restart strategies are implemented only within cma.fmin()
+            self.asktell = self._cma_asktell
+            # bbobbenchmarks functions accept row-format matrices
+            self.vectorized = True
 
-        if 'restarts' in self.minimizer_kwargs:
-            self.minimizer_kwargs['dim'] = self.fi.dim
+    def _cma_asktell(self, x0):
+        return _cma.CMAEvolutionStrategy(x0, 10./4., self.call_kwargs()['options'])
 
     def _setup_scipy(self, name):
         if name.lower() in ['anneal', 'cobyla']:
             raise RuntimeError('MinimizationMethod does not support SciPy method %s (does not provide callback functionality).' % name)
 
-        self.minimizer_kwargs = dict(
+        dim = self.fi.dim
+        self.minimizer_kwargs = _cached_kwargs(name, dim, lambda: dict(
                 method=name,
                 # Bounded local optimizers
-                bounds=[(-6., +6.) for d in range(self.fi.dim)],
+                bounds=tuple((-6., +6.) for d in range(dim)),
                 # COBYLA
-                constraints=({"type": "ineq", "fun": lambda x: np.min(x+5)},
-                             {"type": "ineq", "fun": lambda x: np.min(-(x-5))}),
+                constraints=({"type": "ineq", "fun": _constraint_lower},
+                             {"type": "ineq", "fun": _constraint_upper}),
+            ))
+        self.lazy_kwargs = dict(
                 # Specific options
-                options=dict(
+                options=lambda: dict(
                     # COBYLA
                     rhoend=self.fi.f.precision,
                 ),
             )
 
+    def call_kwargs(self):
+        """
+        Return the minimizer parameters to use for a minimization
+        started now, with ``lazy_kwargs`` resolved.
+        """
+        kwargs = dict(self.minimizer_kwargs)
+        for (key, resolve) in self.lazy_kwargs.iteritems():
+            kwargs[key] = resolve()
+        return kwargs
+
     def __call__(self, fun, x0, inner_cb=None, outer_cb=None):
         """
         A callable interface.  Call on ``fun`` objective function with
@@ -186,27 +218,217 @@ class MinimizeMethod(object):
         ignore the passed ``x0`` value.
         """
         return self.outer_loop(fun, x0, callback=outer_cb,
-                minimizer_kwargs=dict(callback=inner_cb, **self.minimizer_kwargs))
+                minimizer_kwargs=dict(callback=inner_cb, **self.call_kwargs()))
+
+
+def _basinhopping(*args, **kwargs):
+    # Resolve so.basinhopping only when actually used
+    return so.basinhopping(*args, **kwargs)
+
+
+# Shared minimizer_kwargs of methods, keyed by (name, dim)
+_kwargs_cache = dict()
+
+def _cached_kwargs(name, dim, build):
+    """
+    Return the minimizer_kwargs for the method ``name`` in dimension
+    ``dim``, calling ``build()`` to set them up the first time.
+    """
+    key = (name, dim)
+    try:
+        return _kwargs_cache[key]
+    except KeyError:
+        kwargs = _kwargs_cache[key] = build()
+        return kwargs
+
+def _constraint_lower(x):
+    return np.min(x+5)
+
+def _constraint_upper(x):
+    return np.min(-(x-5))
+
+
+# The cma module, imported on first use
+_cma = None
+
+def _import_cma():
+    global _cma
+    if _cma is None:
+        import cma
+        _cma = cma
+    return _cma
+
+def _cma_wrapper(fun, x0, callback, minimizer_kwargs):
+    class InnerCMACallback:
+        def __init__(self, realcb):
+            self.realcb = realcb
+
+        def __call__(self, cma):
+            self.realcb(cma.best.x)
+
+    cb = minimizer_kwargs.pop('callback')
+    minimizer_kwargs['options']['termination_callback'] = InnerCMACallback(cb) if cb is not None else None
+
+    if 'restarts' in minimizer_kwargs:
+        # We ignore passed x0 in case a restart strategy is employed
+        # as it is important to start at a different point in each restart
+        # (esp. in the smallpop stages of BIPOP, obviously).
+        x0 = '10. * np.random.rand(%d) - 5' % minimizer_kwargs.pop('dim')
+
+    try:
+        return _cma.fmin(fun, x0, 10./4., **minimizer_kwargs)
+    except _cma._Error, e:
+        print "CMA error: " + str(e)
+        return None
+
+
+# All SteppingData instances with possibly unflushed records
+_open_steppingdata = weakref.WeakSet()
+
+def _flush_all_steppingdata():
+    for data in list(_open_steppingdata):
+        data.flush()
+
+atexit.register(_flush_all_steppingdata)
+
+_sigquit_prev = None
+
+def _sigquit_handler(signum, frame):
+    """
+    Flush all .mdat files on SIGQUIT (Ctrl-\\), which is the recommended
+    way to interrupt experiments, then proceed as before.
+    """
+    _flush_all_steppingdata()
+    if callable(_sigquit_prev):
+        _sigquit_prev(signum, frame)
+    else:
+        signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGQUIT)
+
+def _sigquit_install():
+    global _sigquit_prev
+    if _sigquit_prev is not None:
+        return
+    try:
+        _sigquit_prev = signal.signal(signal.SIGQUIT, _sigquit_handler)
+    except ValueError:
+        pass # not in the main thread; we will retry next time
+
+
+def _parse_flush(spec):
+    """
+    Parse a flush interval specification like "1000", "10s"
+    or "1000,10s" to a (records, seconds) tuple.  Either limit
+    is None if not given.
+    """
+    records = None
+    secs = None
+    for item in spec.split(','):
+        if item.endswith('s'):
+            secs = float(item[:-1])
+        else:
+            records = int(item)
+    return (records, secs)
+
+
+# The binary .mdatb record format; method is an index to the list of names
+# in the accompanying .mdatb.methods file.  Each SteppingData run starts with
+# a marker record with member (and method) -1.
+MDAT_DTYPE = np.dtype([
+        ('evals', '<i8'),        # function evaluation
+        ('iter', '<i8'),         # portfolio iteration
+        ('member', '<i4'),       # instance index
+        ('method', '<i4'),       # instance method id
+        ('invocations', '<i8'),  # instance invocations
+        ('fitness', '<f8'),      # instance best noise-free fitness - Fopt
+        ('best', '<f8'),         # best noise-free fitness - Fopt
+    ])
 
 
 class SteppingData:
     """
     This class logs data on current progress of method stepping
     (typically after each method iteration) to an .mdat file.
+
+    By default, each record is flushed to the file right away.
+    In buffered mode, records are flushed only after every
+    ``flush_records`` records or ``flush_secs`` seconds, whatever
+    comes first (either may be None for no limit); they are also always flushed on close(), at exit
+    and on SIGQUIT.  The defaults can be set by the $COCOPF_MDAT_FLUSH
+    environment variable, e.g. "1000", "10s" or "1000,10s".
+
+    ``compress`` may be 'gz' or 'zst' (requires the zstandard module)
+    to write a compressed .mdat.gz or .mdat.zst file instead; this is
+    set by $COCOPF_MDAT_COMPRESS by default.
+
+    ``fmt`` may be 'text' (the .mdat file), 'binary' (an .mdatb file with
+    fixed-size MDAT_DTYPE records, see load_mdatb()) or 'both'; this is
+    set by $COCOPF_MDAT_FORMAT by default.  The binary file is never
+    compressed so that it can be memory-mapped.
     """
-    def __init__(self, fi):
+    def __init__(self, fi, flush_records=None, flush_secs=None, compress=None, fmt=None):
         self.f = fi.f
         self.total_iters = 0
         self.last_best = None
 
+        if flush_records is None and flush_secs is None:
+            (flush_records, flush_secs) = _parse_flush(os.environ.get('COCOPF_MDAT_FLUSH') or '1')
+        self.flush_records = flush_records
+        self.flush_secs = flush_secs
+        if compress is None:
+            compress = os.environ.get('COCOPF_MDAT_COMPRESS')
+        if fmt is None:
+            fmt = os.environ.get('COCOPF_MDAT_FORMAT', 'text')
+        if fmt not in ['text', 'binary', 'both']:
+            raise ValueError('Unknown .mdat format ' + str(fmt))
+        self.buf = []
+        self.binbuf = []
+        self.last_flush = time.time()
+
         # XXX: This is evil; copied from beginning of fgeneric.evalfun()
         if not self.f._is_setdim or self.f._dim != fi.dim:
             self.f._setdim(fi.dim)
         if not self.f._is_ready():
             self.f._readytostart()
+        basename = os.path.splitext(self.f.datafile)[0]
 
-        self.datafile = open(os.path.splitext(self.f.datafile)[0] + '.mdat', 'a')
-        self.datafile.write("% function evaluation | portfolio iteration | instance index | instance method | instance invocations | instance best noise-free fitness - Fopt | best noise-free fitness - Fopt\n")  # | x1 | x2...
+        if fmt != 'binary':
+            self.datafile = self._open(basename + '.mdat', compress)
+            self.buf.append("% function evaluation | portfolio iteration | instance index | instance method | instance invocations | instance best noise-free fitness - Fopt | best noise-free fitness - Fopt\n")  # | x1 | x2...
+        else:
+            self.datafile = None
+
+        if fmt != 'text':
+            self.binfile = open(basename + '.mdatb', 'ab')
+            self.methodsfile = basename + '.mdatb.methods'
+            self.methods = _load_methods(self.methodsfile)
+            self.binbuf.append((0, 0, -1, -1, 0, np.nan, np.nan))
+        else:
+            self.binfile = None
+
+        _open_steppingdata.add(self)
+        _sigquit_install()
+
+    def _open(self, filename, compress):
+        if not compress:
+            return open(filename, 'a')
+        elif compress == 'gz':
+            # Appending creates a new gzip member, which is fine
+            return gzip.open(filename + '.gz', 'ab')
+        elif compress == 'zst':
+            import zstandard
+            return zstandard.ZstdCompressor().stream_writer(open(filename + '.zst', 'ab'))
+        else:
+            raise ValueError('Unknown .mdat compression ' + str(compress))
+
+    def _method_id(self, name):
+        try:
+            return self.methods.index(name)
+        except ValueError:
+            with open(self.methodsfile, 'a') as f:
+                f.write(name + '\n')
+            self.methods.append(name)
+            return len(self.methods) - 1
 
     def end_iter(self):
         self.total_iters += 1
@@ -214,19 +436,93 @@ class SteppingData:
     def record(self, i, name, iters, fitness, point):
         e = self.f.lasteval
         best = e.bestf - self.f.fopt
-        res = ('%d %d %d %s %d %+10.9e'
-               % (e.num, self.total_iters, i, name, iters, fitness))
-
-        if self.last_best is None or best != self.last_best:
-            res += (' %+10.9e' % best)
-            self.last_best = best
-
-        # This information is not really useful and taking it out reduces
-        # the uncompressed .mdat file size to 1/5.
-        # tmp = []
-        # for x in point:
-        #     tmp.append(' %+5.4e' % x)
-        # res += ''.join(tmp)
-
-        self.datafile.write(res + '\n')
-        self.datafile.flush()
+
+        if self.binfile is not None:
+            self.binbuf.append((e.num, self.total_iters, i, self._method_id(name),
+                                iters, fitness, best))
+
+        if self.datafile is not None:
+            res = ('%d %d %d %s %d %+10.9e'
+                   % (e.num, self.total_iters, i, name, iters, fitness))
+
+            if self.last_best is None or best != self.last_best:
+                res += (' %+10.9e' % best)
+                self.last_best = best
+
+            # This information is not really useful and taking it out reduces
+            # the uncompressed .mdat file size to 1/5.
+            # tmp = []
+            # for x in point:
+            #     tmp.append(' %+5.4e' % x)
+            # res += ''.join(tmp)
+
+            self.buf.append(res + '\n')
+
+        if self.flush_records is not None and max(len(self.buf), len(self.binbuf)) >= self.flush_records:
+            self.flush()
+        elif self.flush_secs is not None and time.time() - self.last_flush >= self.flush_secs:
+            self.flush()
+
+    def flush(self):
+        """
+        Write out all buffered records.
+        """
+        if self.datafile is not None:
+            if self.buf:
+                self.datafile.write(''.join(self.buf))
+                self.buf = []
+            self.datafile.flush()
+        if self.binfile is not None:
+            if self.binbuf:
+                self.binfile.write(np.array(self.binbuf, dtype=MDAT_DTYPE).tostring())
+                self.binbuf = []
+            self.binfile.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        """
+        Flush and close the .mdat file; no more records may be recorded.
+        """
+        self.flush()
+        if self.datafile is not None:
+            self.datafile.close()
+            self.datafile = None
+        if self.binfile is not None:
+            self.binfile.close()
+            self.binfile = None
+        _open_steppingdata.discard(self)
+
+
+def _load_methods(filename):
+    try:
+        with open(filename) as f:
+            return [line.rstrip('\n') for line in f]
+    except IOError:
+        return []
+
+def load_mdatb(filename):
+    """
+    Memory-map a binary .mdatb file written by SteppingData.  Returns
+    a (records, methods) tuple, where records is a NumPy structured array
+    of MDAT_DTYPE and methods is the list of method names indexed by
+    the records' method field.  Example:
+
+    >>> (recs, methods) = load_mdatb('data_f1/bbobexp_f1_DIM5.mdatb')
+    >>> cma = recs[recs['method'] == methods.index('CMA')]
+    >>> runs = mdatb_runs(recs)
+    """
+    methods = _load_methods(filename + '.methods')
+    if os.path.getsize(filename) < MDAT_DTYPE.itemsize:
+        return (np.zeros(0, dtype=MDAT_DTYPE), methods)
+    # Ignore a trailing partially written record, if any
+    count = os.path.getsize(filename) // MDAT_DTYPE.itemsize
+    return (np.memmap(filename, dtype=MDAT_DTYPE, mode='r', shape=(count,)), methods)
+
+def mdatb_runs(records):
+    """
+    Split .mdatb records (as returned by load_mdatb()) to a list of
+    per-run record arrays (views), without the run marker records.
+    """
+    starts = np.nonzero(records['member'] == -1)[0]
+    ends = np.append(starts[1:], len(records))
+    return [records[s+1:e] for (s, e) in zip(starts, ends)]
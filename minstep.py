@@ -5,27 +5,57 @@
 A wrapper to scipy.optimize.minimize that returns after each iteration
 (and resumes again on demand), i.e. provides an iteration by iteration
 stepping functionality.
+
+There are several stepping backends with the same next() / stop()
+interface; use minimize_stepping() to pick the one configured
+for a given MinimizeMethod:
+
+    * MinimizeStepping runs the minimizer in a separate thread and hands
+      over control via queues.  Works with any minimizer that supports
+      a callback, but each step costs a couple of context switches.
+      The threads are reused for subsequent minimizations.
+
+    * GreenletStepping runs the minimizer in a greenlet (coroutine)
+      instead, so a step is just a cheap stack switch.  Requires
+      the greenlet module (`pip install greenlet`) and must be opted
+      into explicitly, as a greenlet cannot be stepped from any other
+      thread than the one that created it.
+
+    * AskTellStepping drives minimizers with a native ask/tell interface
+      (like CMA-ES) directly, one generation per step.
 """
 
+import collections
+import os
 import threading
 import traceback
 from Queue import Queue
 
 import numpy as np
 import numpy.random as nr
-import scipy.optimize as so
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
 
 
 class ThreadCancel(Exception):
     pass
 
 class MinimizeThread(threading.Thread):
-    def __init__(self, fun, x0, minmethod):
+    """
+    A worker thread running minimization jobs for MinimizeStepping.
+    When a job finishes (or is stopped), the thread parks itself in
+    a pool and waits for another job, so that we do not need to spawn
+    a new thread every time a minimizer is restarted.
+    """
+    def __init__(self):
         threading.Thread.__init__(self)
+        self.daemon = True
 
-        self.fun = fun
-        self.x0 = x0
-        self.minmethod = minmethod
+        # jobq passes (fun, x0, minmethod) jobs to the thread
+        self.jobq = Queue(maxsize = 1)
 
         # iterq passes tuples from the minimization to caller
         self.iterq = Queue(maxsize = 1)
@@ -35,10 +65,25 @@ class MinimizeThread(threading.Thread):
 
         # stopev is used to signalize the minimization should stop
         self.stopev = threading.Event()
+        # idleev is set while the thread is parked without a job
+        self.idleev = threading.Event()
 
-        self.last_x = self.x0
+    def start_job(self, fun, x0, minmethod):
+        self.jobq.put((fun, x0, minmethod))
 
     def run(self):
+        while True:
+            (self.fun, self.x0, self.minmethod) = self.jobq.get()
+            self.last_x = self.x0
+            self.stopev.clear()
+
+            self.run_job()
+
+            # Do not hold on to the job data while parked
+            self.fun = self.x0 = self.minmethod = self.last_x = None
+            _thread_pool_park(self)
+
+    def run_job(self):
         class OICallback:
             # A shim to call self.one_iter()
             def __init__(self, thread):
@@ -62,6 +107,7 @@ class MinimizeThread(threading.Thread):
             if np.any(x != self.last_x):
                 self.one_iter(x)
             self.iterq.put((self.iterq_finished, 0))
+            self.iterq.join() # wait for the next() to pick it up
 
         except ThreadCancel:
             return
@@ -79,6 +125,48 @@ class MinimizeThread(threading.Thread):
             raise ThreadCancel()
 
 
+# Parked MinimizeThread objects waiting for a job
+_thread_pool = []
+_thread_pool_lock = threading.Lock()
+_thread_pool_pid = os.getpid()
+_thread_pool_stats = dict(spawned = 0, spawns_avoided = 0)
+
+def _thread_pool_get():
+    """
+    Get a parked MinimizeThread, or spawn a new one.
+    """
+    global _thread_pool_pid
+    with _thread_pool_lock:
+        if _thread_pool_pid != os.getpid():
+            # We have been forked; the parked threads live only in the parent
+            del _thread_pool[:]
+            _thread_pool_pid = os.getpid()
+        if _thread_pool:
+            thread = _thread_pool.pop()
+            thread.idleev.clear()
+            _thread_pool_stats['spawns_avoided'] += 1
+            return thread
+        _thread_pool_stats['spawned'] += 1
+    thread = MinimizeThread()
+    thread.start()
+    return thread
+
+def _thread_pool_park(thread):
+    with _thread_pool_lock:
+        thread.idleev.set()
+        if _thread_pool_pid == os.getpid():
+            _thread_pool.append(thread)
+
+def thread_pool_stats():
+    """
+    Return a dict with counters of MinimizeThread objects spawned
+    and spawns avoided by reusing parked threads, and the number
+    of currently parked threads.
+    """
+    with _thread_pool_lock:
+        return dict(_thread_pool_stats, parked = len(_thread_pool))
+
+
 class MinimizeStepping:
     """
     Minimization of scalar function of one or more variables. Just like
@@ -96,28 +184,30 @@ class MinimizeStepping:
 
     def __init__(self, fun, x0, minmethod):
         """
-        Initialize the object and also start up the thread.
+        Initialize the object and also hand over the job to a thread.
         """
         self.minmethod = minmethod
 
         # Our design is thread-based, but there is no concurrency!
         # There is always *only one* thread running (either the main
         # thread or MinimizeThread), everything else blocks.
-        self.thread = MinimizeThread(fun, x0, minmethod)
-        self.thread.start()
+        self.thread = _thread_pool_get()
+        self.thread.start_job(fun, x0, minmethod)
 
         # Now block until the thread is initialized...
         self.thread.iterq.get(True)
-        # ...and now self.thread is blocked.
-
-        # Using isAlive() is racy with deinitialization
-        self.thread_alive = True
+        # ...and now self.thread is blocked.  Once the thread goes back
+        # to the pool, self.thread is reset to None (using isAlive()
+        # would be racy with deinitialization, and pooled threads live on).
 
     def next(self):
         """
         Run for a single iteration and return the current x.
-        Throws StopIteration if the minimizer finished (no need to call stop()).
+        Throws StopIteration if the minimizer finished (no need to call stop()),
+        also on any later call.
         """
+        if self.thread is None:
+            raise StopIteration()
         # Unblock self.thread
         self.thread.iterq.task_done()
         # Block us on self.thread
@@ -127,8 +217,11 @@ class MinimizeStepping:
         if msg[0] is self.thread.iterq_iter:
             return msg[1]
         elif msg[0] is self.thread.iterq_finished:
-            self.thread.join()
-            self.thread_alive = False
+            # Let the thread park itself
+            self.thread.iterq.task_done()
+            self.thread.idleev.wait()
+            # It may be handed to someone else now
+            self.thread = None
             raise StopIteration()
         else:
             raise RuntimeError('unknown message %s' % msg)
@@ -138,12 +231,185 @@ class MinimizeStepping:
         Calling this function is *required* in case minimization is
         interrupted early.
         """
-        if not self.thread_alive:
+        if self.thread is None:
             return
+        (thread, self.thread) = (self.thread, None)
         # First set stopev...
-        self.thread.stopev.set()
-        # ...then unblock self.thread, there will be no more messages...
-        self.thread.iterq.task_done()
-        self.thread_alive = False
-        # ...and collect the thread.
-        self.thread.join()
+        thread.stopev.set()
+        # ...then unblock the thread, there will be no more messages...
+        thread.iterq.task_done()
+        # ...and wait until the thread is parked.
+        thread.idleev.wait()
+
+
+class EvalCache:
+    """
+    A wrapper of an objective function that remembers the values
+    of the last ``N`` evaluations, keyed by the evaluated point.
+    Pass it to the minimizer in place of the function and use get()
+    to retrieve the value at a point the minimizer returned instead
+    of evaluating the function again.
+
+    >>> fun = EvalCache(fi.f.evalfun)
+    >>> ms = minimize_stepping(fun, x0, mm)
+    >>> x = ms.next()
+    >>> y = fun.get(x)  # None if not evaluated recently
+    """
+
+    def __init__(self, fun, N = 64):
+        self.fun = fun
+        self.N = N
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, x):
+        y = self.fun(x)
+        if np.ndim(x) == 1:
+            self._store(x, y)
+        elif np.ndim(x) == 2:
+            # A batch of points (rows) evaluated at once
+            for (xi, yi) in zip(x, np.atleast_1d(y)):
+                self._store(xi, yi)
+        return y
+
+    def _store(self, x, y):
+        self.cache[np.asarray(x, dtype = float).tostring()] = y
+        if len(self.cache) > self.N:
+            self.cache.popitem(last = False)
+
+    def get(self, x):
+        """
+        Return the recorded function value at ``x``, or None.
+        """
+        y = self.cache.get(np.asarray(x, dtype = float).tostring())
+        if y is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return y
+
+
+class GreenletStepping:
+    """
+    Just like MinimizeStepping, but the minimizer runs in a greenlet
+    instead of a thread, so there is no locking and no OS-level context
+    switching involved in stepping.
+    """
+
+    def __init__(self, fun, x0, minmethod):
+        if greenlet is None:
+            raise RuntimeError('GreenletStepping requires the greenlet module')
+        self.fun = fun
+        self.x0 = x0
+        self.minmethod = minmethod
+
+        self.last_x = self.x0
+        self.finished = object()
+        # The minimization starts only on the first next()
+        self.glet = greenlet.greenlet(self._run)
+
+    def _run(self):
+        r = self.minmethod(self.fun, self.x0, inner_cb = self._one_iter)
+
+        # Report the final result (XXX: or is it a dupe?)
+        x = getattr(r, 'x', self.x0)
+        if np.any(x != self.last_x):
+            self._one_iter(x)
+        return self.finished
+
+    def _one_iter(self, xk):
+        """
+        Called after every iteration of minimize.
+        """
+        self.last_x = xk
+        # Switch back to the next() caller; stop() will throw
+        # GreenletExit at us here.
+        self.glet.parent.switch(xk)
+
+    def next(self):
+        """
+        Run for a single iteration and return the current x.
+        Throws StopIteration if the minimizer finished (no need to call stop()).
+        """
+        if self.glet.dead:
+            raise StopIteration()
+        msg = self.glet.switch()
+        if msg is self.finished:
+            raise StopIteration()
+        return msg
+
+    def stop(self):
+        """
+        Calling this function is recommended in case minimization is
+        interrupted early, to release the minimizer state right away.
+        """
+        if not self.glet.dead:
+            self.glet.throw()
+
+
+class AskTellStepping:
+    """
+    Stepping of minimizers with a native ask/tell interface, like
+    `cma.CMAEvolutionStrategy`.  The minimizer object is created by
+    calling ``minmethod.asktell(x0)``; each step evaluates and tells
+    a single generation of candidate solutions and returns the best
+    solution found so far.
+
+    If ``minmethod.vectorized`` is set, the whole generation is evaluated
+    by a single call of ``fun`` on a matrix with the solutions as rows
+    (fgeneric.LoggingFunction.evalfun() supports that and still counts
+    and logs each evaluation).
+    """
+
+    def __init__(self, fun, x0, minmethod):
+        if getattr(minmethod, 'asktell', None) is None:
+            raise RuntimeError('%s does not provide an ask/tell interface' % minmethod.name)
+        self.fun = fun
+        self.minmethod = minmethod
+        self.es = minmethod.asktell(x0)
+
+    def next(self):
+        """
+        Run for a single iteration and return the current x.
+        Throws StopIteration if the minimizer finished (no need to call stop()).
+        """
+        if self.es.stop():
+            raise StopIteration()
+        if getattr(self.minmethod, 'vectorized', False):
+            X = self.es.ask()
+            fit = np.atleast_1d(self.fun(np.array(X)))
+            self.es.tell(X, list(fit))
+        else:
+            X, fit = self.es.ask_and_eval(self.fun)
+            self.es.tell(X, fit)
+        return self.es.best.x
+
+    def stop(self):
+        pass
+
+
+def minimize_stepping(fun, x0, minmethod):
+    """
+    Create a stepping object for the given MinimizeMethod, picking
+    the backend according to its ``stepping`` attribute: 'thread',
+    'greenlet', 'asktell' or 'auto' (the default), which means 'asktell'
+    if the method supports it and 'thread' otherwise.  'greenlet' is
+    never picked automatically; it is faster, but the stepping object
+    is then bound to the thread that created it.
+    """
+    stepping = getattr(minmethod, 'stepping', 'thread')
+    if stepping == 'auto':
+        if getattr(minmethod, 'asktell', None) is not None:
+            stepping = 'asktell'
+        else:
+            stepping = 'thread'
+
+    if stepping == 'asktell':
+        return AskTellStepping(fun, x0, minmethod)
+    elif stepping == 'greenlet':
+        return GreenletStepping(fun, x0, minmethod)
+    elif stepping == 'thread':
+        return MinimizeStepping(fun, x0, minmethod)
+    else:
+        raise ValueError('Unknown stepping backend ' + str(stepping))
@@ -7,17 +7,41 @@ keep track of solutions and respective minimizer states.
 
 Solution search progress (in respect to method population) is
 recorded to an .mdat file.
+
+ParallelPopulation is a variant that keeps the minimizers in a pool
+of worker processes, allowing to step multiple members concurrently;
+this is useful for expensive objective functions.
+
+Besides the blocking step_one(), ParallelPopulation provides a futures
+based interface for stepping members concurrently: astep() returns
+a concurrent.futures.Future of the step result and as_completed()
+iterates over futures as they finish.  (On Python 2, this requires
+the futures backport, `pip install futures`.)  A plain Population
+implements the same interface so that strategies can be written for
+both, but it steps synchronously, without any concurrency: the
+minimizers (e.g. greenlet based ones) and the fgeneric logging are
+bound to the calling thread.
 """
 
+import multiprocessing
+import signal
 import string
 import sys
+import threading
 import time
+import traceback
 import warnings
 
 import numpy as np
 import numpy.random as nr
 
-from cocopf.minstep import MinimizeStepping
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+from cocopf.growarray import GrowingArray
+from cocopf.minstep import EvalCache, minimize_stepping
 from cocopf.methods import SteppingData
 
 
@@ -25,20 +49,32 @@ class Population:
     """
     ``points`` contains the solution points of the population.
     ``minimizers`` contains the optimizer instances associated with these points.
+
+    The ``points``, ``values`` and ``iters`` arrays are views of growable
+    storage; add() replaces them with new views, so do not keep references
+    to them across add() calls.  Members may be removed by remove(),
+    which just marks them as dead (see ``alive``), and compact().
     """
     def __init__(self, fi, K, methods):
         self.fi = fi
         self.K = K
         self.methods = methods
 
+        # The objective function as seen by minimizers; the cache lets
+        # us learn values at stepped points without evaluating them again
+        self.evalfun = EvalCache(self.fi.f.evalfun)
+
         # A population of solution x points
-        self.points = 10. * np.random.rand(self.K, self.fi.dim) - 5.
+        self._points = GrowingArray(10. * np.random.rand(self.K, self.fi.dim) - 5.)
         # A population of solution y points
-        self.values = np.zeros(self.K) + 1e10
+        self._values = GrowingArray(np.zeros(self.K) + 1e10)
+        # A population of iteration counters
+        self._iters = GrowingArray(np.zeros(self.K, dtype = np.int))
+        # A mask of members that were not removed
+        self._alive = GrowingArray(np.ones(self.K, dtype = bool))
+        self._views_update()
         # A population of minimizers
         self.minimizers = [self._minimizer_make(i) for i in range(self.K)]
-        # A population of iteration counters
-        self.iters = np.zeros(self.K, dtype = np.int)
 
         self.total_steps = 0
         self.total_iters = 0
@@ -46,7 +82,7 @@ class Population:
 
     def _minimizer_make(self, i):
         warnings.simplefilter("ignore") # ignore warnings about unused/ignored options
-        return MinimizeStepping(self.fi.f.evalfun, self.points[i],
+        return minimize_stepping(self.evalfun, self.points[i],
                 self.methods[i % len(self.methods)])
 
     def step_one(self, i):
@@ -68,13 +104,46 @@ class Population:
                 # so make a step right away
                 continue
 
+        y = self._step_done(i, x)
+        return (x, y)
+
+    def _step_done(self, i, x):
+        """
+        Account for a finished step of member i that reached x.
+        Returns the function value at x.
+        """
         # Get the value at this point
-        y = self.fi.evalfun(x)
+        y = self.evalfun.get(x)
+        if y is None:
+            y = self.fi.evalfun(x)
         self.values[i] = y
         self.iters[i] += 1
         self.total_steps += 1
         self.data.record(i, self.minimizers[i].minmethod.name, self.iters[i], self.values[i] - self.fi.f.fopt, self.points[i])
-        return (x, y)
+        return y
+
+    def astep(self, i):
+        """
+        Like step_one(), but returns a Future of the (x,y) result.
+        In a plain Population, this does not provide any concurrency:
+        the step is performed right away and the returned future is
+        already done.  Use ParallelPopulation for concurrent steps.
+        """
+        if futures is None:
+            raise RuntimeError('Population.astep() requires the concurrent.futures module')
+        fut = futures.Future()
+        try:
+            fut.set_result(self.step_one(i))
+        except Exception, e:
+            fut.set_exception(e)
+        return fut
+
+    def as_completed(self, fs):
+        """
+        An iterator over the futures ``fs`` (as returned by astep())
+        that yields them as they complete.
+        """
+        return futures.as_completed(fs)
 
     def restart_one(self, i):
         """
@@ -93,11 +162,12 @@ class Population:
         """
         Add another population member.
         """
-        self.points = np.append(self.points, [10. * np.random.rand(self.fi.dim) - 5.], axis = 0)
-        self.values = np.append(self.values, [1e10], axis = 0)
-        i = len(self.points) - 1
+        i = self._points.append(10. * np.random.rand(self.fi.dim) - 5.)
+        self._values.append(1e10)
+        self._iters.append(0)
+        self._alive.append(True)
+        self._views_update()
         self.minimizers.append(self._minimizer_make(i))
-        self.iters = np.append(self.iters, [0], axis = 0)
 
         #y = self.fi.f.evalfun(self.points[i]) # This is just for the debug print
         #print("#%d new member %s=%s" % (i, self.points[i], y))
@@ -105,6 +175,35 @@ class Population:
         return i
 
 
+    def remove(self, i):
+        """
+        Remove a given population member.  The member is just marked
+        as dead (with an infinite value) until compact() is called.
+        """
+        self.minimizers[i].stop()
+        self.alive[i] = False
+        self.values[i] = np.inf
+
+    def compact(self):
+        """
+        Drop all removed members, renumbering the remaining ones
+        (preserving their order).  Returns the boolean mask of kept
+        members, e.g. for PopulationCredit.compact().
+        """
+        keep = self.alive.copy()
+        for store in [self._points, self._values, self._iters, self._alive]:
+            store.compact(keep)
+        self._views_update()
+        self.minimizers = [m for (m, k) in zip(self.minimizers, keep) if k]
+        return keep
+
+    def _views_update(self):
+        self.points = self._points.view
+        self.values = self._values.view
+        self.iters = self._iters.view
+        self.alive = self._alive.view
+        self.K = len(self.points)
+
     def end_iter(self):
         """
         Notify the population that a single portfolio iteration has passed.
@@ -115,5 +214,283 @@ class Population:
         self.data.end_iter()
 
     def stop(self):
-        for m in self.minimizers:
-            m.stop()
+        for (m, alive) in zip(self.minimizers, self.alive):
+            if alive:
+                m.stop()
+        self.data.close()
+
+
+
+class ParallelPopulation(Population):
+    """
+    A Population whose minimizers live in a pool of ``workers`` worker
+    processes (one per CPU by default), members assigned round-robin.
+    Use step_many() or astep() to step multiple members concurrently;
+    step_one() works as usual.
+
+    The workers evaluate the objective function on their own, but all
+    the evaluations are reconciled to the fgeneric logging function in
+    this process (in the order of finished steps), so the COCO data are
+    the same as if the evaluations were done here.  This and all the
+    other bookkeeping is done by a collector thread as the step results
+    arrive, which also completes the astep() futures.
+
+    A ParallelPopulation must be created after the function instance
+    is set up, i.e. within the minimization of a single FInstance.
+    """
+    def __init__(self, fi, K, methods, workers=None):
+        if futures is None:
+            raise RuntimeError('ParallelPopulation requires the concurrent.futures module')
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.resultq = multiprocessing.Queue()
+        self.cmdqs = []
+        self.workers = []
+        for w in range(workers):
+            cmdq = multiprocessing.Queue()
+            p = multiprocessing.Process(target=_member_worker, args=(fi, methods, cmdq, self.resultq))
+            p.daemon = True
+            p.start()
+            self.cmdqs.append(cmdq)
+            self.workers.append(p)
+
+        # Steps in flight, i -> [future, retries]
+        self.inflight = dict()
+        # The worker of each member (members keep their worker
+        # when renumbered by compact())
+        self.owner = []
+        self.lock = threading.RLock()
+        self.collector = threading.Thread(target=self._collect)
+        self.collector.daemon = True
+        self.collector.start()
+
+        Population.__init__(self, fi, K, methods)
+
+    def _minimizer_make(self, i):
+        return RemoteStepping(self, i, self.points[i], self.methods[i % len(self.methods)])
+
+    def _send(self, i, cmd):
+        with self.lock:
+            if i == len(self.owner):
+                # A new member
+                self.owner.append(i % len(self.cmdqs))
+            self.cmdqs[self.owner[i]].put(cmd)
+
+    def _collect(self):
+        """
+        The collector thread main loop, processing step results.
+        """
+        while True:
+            msg = self.resultq.get()
+            if msg is None:
+                return
+            (i, kind, x, log) = msg
+            with self.lock:
+                fs = [fut for (fut, retries) in self.inflight.values()]
+                try:
+                    self._replay(log)
+                    self._collect_one(i, kind, x)
+                except Exception, e:
+                    # Do not leave anyone waiting for the steps in flight
+                    # (we cannot tell which ones are still consistent)
+                    sys.stderr.write('population collector failed:\n%s' % traceback.format_exc())
+                    for fut in fs:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    self.inflight.clear()
+
+    def _collect_one(self, i, kind, x):
+        if i not in self.inflight:
+            # Failure outside of a step (e.g. minimizer setup); the next
+            # step of the member is going to fail as well
+            sys.stderr.write('population member #%d failed:\n%s' % (i, x))
+            return
+        (fut, retries) = self.inflight[i]
+        if kind == 'error':
+            del self.inflight[i]
+            fut.set_exception(RuntimeError('population member #%d failed:\n%s' % (i, x)))
+            return
+        if kind == 'stop':
+            # Local optimum, pick a new random point
+            self.restart_one(i)
+            if retries == 0:
+                # We did no computation for [i] yet in this iteration
+                # so make a step right away
+                self.inflight[i][1] += 1
+                self._send(i, ('step', i))
+                return
+            x = self.points[i]
+        else:
+            self.points[i] = x
+        del self.inflight[i]
+        y = self._step_done(i, x)
+        fut.set_result((x, y))
+
+    def _replay(self, log):
+        """
+        Pass the evaluations done by a worker through the logging function,
+        substituting recorded values for the actual function evaluation.
+        """
+        if not log:
+            return
+        f = self.fi.f
+        saved = f.__dict__.get('_fun_evalfull')
+        try:
+            for (x, out) in log:
+                f._fun_evalfull = lambda x, out=out: out
+                self.evalfun(x)
+        finally:
+            if saved is None:
+                del f._fun_evalfull
+            else:
+                f._fun_evalfull = saved
+
+    def astep(self, i):
+        """
+        Start a single minimization step with member i, returning
+        a Future of the (x,y) result.  Only one step of a given member
+        may be in flight at a time.
+        """
+        with self.lock:
+            if i in self.inflight:
+                raise RuntimeError('population member #%d is already being stepped' % i)
+            fut = futures.Future()
+            self.inflight[i] = [fut, 0]
+            self._send(i, ('step', i))
+        return fut
+
+    def as_completed(self, fs):
+        return futures.as_completed(fs)
+
+    def add(self):
+        with self.lock:
+            return Population.add(self)
+
+    def remove(self, i):
+        with self.lock:
+            if i in self.inflight:
+                raise RuntimeError('population member #%d is being stepped, cannot remove it' % i)
+            Population.remove(self, i)
+
+    def compact(self):
+        """
+        Like Population.compact(); no steps may be in flight.  The workers
+        are told to renumber their minimizers accordingly.
+        """
+        with self.lock:
+            if self.inflight:
+                raise RuntimeError('cannot compact a population with steps in flight')
+            keep = Population.compact(self)
+            renumber = dict()
+            for (i, old) in enumerate(np.nonzero(keep)[0]):
+                renumber[int(old)] = i
+            for cmdq in self.cmdqs:
+                cmdq.put(('renumber', None, renumber))
+            self.owner = [w for (w, k) in zip(self.owner, keep) if k]
+            for (i, m) in enumerate(self.minimizers):
+                m.i = i
+            return keep
+
+    def step_one(self, i):
+        return self.astep(i).result()
+
+    def step_many(self, indices):
+        """
+        Perform a single minimization step with each of the members
+        listed in ``indices`` concurrently.  This is an iterator that
+        yields (i, x, y) tuples in the order in which the steps finish.
+        """
+        fs = dict((self.astep(i), i) for i in indices)
+        for fut in self.as_completed(fs):
+            (x, y) = fut.result()
+            yield (fs[fut], x, y)
+
+    def end_iter(self):
+        with self.lock:
+            Population.end_iter(self)
+
+    def stop(self):
+        # Let the steps in flight finish so that they are accounted for
+        with self.lock:
+            fs = [fut for (fut, retries) in self.inflight.values()]
+        futures.wait(fs)
+        Population.stop(self)
+        for cmdq in self.cmdqs:
+            cmdq.put(('quit', None))
+        for p in self.workers:
+            p.join()
+        self.resultq.put(None)
+        self.collector.join()
+
+
+class RemoteStepping:
+    """
+    A proxy of a stepping object of a ParallelPopulation member,
+    living in a worker process.  Stepping is done by the population
+    itself, see ParallelPopulation.astep().
+    """
+    def __init__(self, pop, i, x0, minmethod):
+        self.pop = pop
+        self.i = i
+        self.minmethod = minmethod
+        self.pop._send(i, ('make', i, x0, pop.fi.f.evaluations))
+
+    def stop(self):
+        self.pop._send(self.i, ('stop', self.i))
+
+
+def _member_worker(fi, methods, cmdq, resultq):
+    """
+    The main loop of a ParallelPopulation worker process.
+    """
+    # Leave SIGQUIT handling (flushing data files) to the parent
+    signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+    warnings.simplefilter("ignore") # ignore warnings about unused/ignored options
+
+    # Evaluate the objective as fgeneric would, recording the evaluations
+    log = []
+    evalfull = fi.f._fun_evalfull
+    def fun(inputx):
+        if fi.f._is_rowformat:
+            x = np.asarray(inputx)
+        else:
+            x = np.transpose(inputx)
+        out = evalfull(x)
+        # Minimizers may reuse (and overwrite) the buffer of inputx
+        log.append((np.array(inputx, copy=True), out))
+        return out[0] if isinstance(out, tuple) else out
+
+    steppings = dict()
+    while True:
+        cmd = cmdq.get()
+        i = cmd[1]
+        try:
+            if cmd[0] == 'make':
+                if i in steppings:
+                    steppings[i].stop()
+                # Our fi.f does not see the evaluations (not even ours);
+                # the minimizer setup resolves the remaining budget by this
+                # (fi.f.evaluations is a read-only view of lasteval.num)
+                fi.f.lasteval.num = cmd[3]
+                steppings[i] = minimize_stepping(fun, cmd[2], methods[i % len(methods)])
+            elif cmd[0] == 'step':
+                try:
+                    x = steppings[i].next()
+                    resultq.put((i, 'step', x, log))
+                except StopIteration:
+                    resultq.put((i, 'stop', None, log))
+                log = []
+            elif cmd[0] == 'stop':
+                if i in steppings:
+                    steppings.pop(i).stop()
+            elif cmd[0] == 'renumber':
+                # Members were compacted, removed ones are stopped already
+                renumber = cmd[2]
+                steppings = dict((renumber[j], ms) for (j, ms) in steppings.iteritems() if j in renumber)
+            elif cmd[0] == 'quit':
+                for ms in steppings.values():
+                    ms.stop()
+                return
+        except Exception:
+            resultq.put((i, 'error', traceback.format_exc(), log))
+            log = []
@@ -16,17 +16,39 @@ compared to algorithm analysis done by stock COCO.
     ax = fig.add_subplot(111)
     cocopf.pplot.fval_by_budget(ax, pds, dim=5, funcId=11)
     fig.show()
+
+matplotlib.pyplot and the COCO post-processing modules are imported only
+on first use.  matplotlib picks its default backend, unless
+$COCOPF_HEADLESS is set; then the non-interactive Agg backend is selected
+(suitable for rendering to files), as does calling headless() before
+plotting.
 """
 
+import os
 import sys
 import numpy as np
-from pylab import *
 
 sys.path.append('.')
-import bbob_pproc as bb
-import bbob_pproc.genericsettings
-import bbob_pproc.pproc as pp
-import bbob_pproc.readalign as ra
+from cocopf.lazy import LazyModule
+from cocopf.pproc import det_evals, det_evals_batch
+
+
+def headless():
+    """
+    Select the non-interactive Agg matplotlib backend.  This must be
+    called before matplotlib.pyplot is first used.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+def _backend_setup():
+    if os.environ.get('COCOPF_HEADLESS'):
+        headless()
+
+plt = LazyModule('matplotlib.pyplot', setup=_backend_setup)
+genericsettings = LazyModule('bbob_pproc.genericsettings')
+pp = LazyModule('bbob_pproc.pproc')
+ra = LazyModule('bbob_pproc.readalign')
 
 
 class GroupByMedian:
@@ -55,7 +77,7 @@ def _style_strategy(name, i):
     if name.startswith('mUNIF'):
         return _style_thickline({ 'color': 'wheat' })
 
-    styles = bb.genericsettings.line_styles
+    styles = genericsettings.line_styles
     style = styles[i % len(styles)].copy()
     del style['linestyle']
 
@@ -81,7 +103,7 @@ def _pds_plot_iterator(pds, dim, funcId):
         yield ('algorithm', algname, ds, _style_algorithm(algname, i))
         i += 1
     yield ('oracle', 'oracle', pds.oracle((dim, funcId)), _style_oracle())
-    yield ('unifpf', 'eUNIF', pds.unifpf().dictByDimFunc()[dim][funcId][0], _style_unifpf())
+    yield ('unifpf', 'eUNIF', pds.unifpf_dimfunc((dim, funcId)), _style_unifpf())
     i = 0
     for (stratname, ds) in pds.stratds_dimfunc((dim, funcId)):
         yield ('strategy', stratname, ds, _style_strategy(stratname, i))
@@ -182,11 +204,7 @@ def rank_by_budget(ax, pds, dim=None, funcId=None, groupby=None):
         # _pds_plot_iterator[] uses funcId only for things we don't care for
         fakeFuncId = funcId[0]
 
-        manyranking = np.array([pds.ranking((dim, i), groupby) for i in funcId])
-        rankcount = np.shape(manyranking[0])[1] - 1
-        amanyranking = ra.alignArrayData(ra.VArrayMultiReader(manyranking))
-        budget = amanyranking[:,0]
-        rankings = np.hsplit(amanyranking[:,1:], len(funcId))
+        (budget, rankings) = pds.ranking_batch(dim, funcId, groupby)
         avgranking = np.average(rankings, axis=0)
         ranking = np.vstack([budget, avgranking.T]).T
 
@@ -248,11 +266,13 @@ def evals_by_target(ax, pds, baseline_ds=None, baseline_label="", dim=None, func
     targets = target_values((funcId, dim))
 
     if baseline_ds:
-        baseline_fevs = groupby(baseline_ds.detEvals(targets), axis=1)
+        baseline_fevs = groupby(det_evals(baseline_ds, targets), axis=1)
 
-    for (kind, name, ds, style) in _pds_plot_iterator(pds, dim, funcId):
+    curves = list(_pds_plot_iterator(pds, dim, funcId))
+    allevals = det_evals_batch([ds for (kind, name, ds, style) in curves], targets)
+    for ((kind, name, ds, style), evals) in zip(curves, allevals):
         #print name, ds
-        fevs = groupby(ds.detEvals(targets), axis=1)
+        fevs = groupby(evals, axis=1)
         if baseline_ds:
             fevs /= baseline_fevs
         style['markevery'] = 64
@@ -289,20 +309,22 @@ def evals_by_evals(ax, pds, baseline1_ds=None, baseline1_label="", baseline2_ds=
     targets = target_values((funcId, dim))
 
     if baseline1_ds:
-        baseline1_fevs = np.array(groupby(baseline1_ds.detEvals(targets), axis=1))
+        baseline1_fevs = np.array(groupby(det_evals(baseline1_ds, targets), axis=1))
     if baseline2_ds:
-        baseline2_fevs = np.array(groupby(baseline2_ds.detEvals(targets), axis=1))
+        baseline2_fevs = np.array(groupby(det_evals(baseline2_ds, targets), axis=1))
 
-    for (kind, name, ds, style) in _pds_plot_iterator(pds, dim, funcId):
+    curves = list(_pds_plot_iterator(pds, dim, funcId))
+    allevals = det_evals_batch([ds for (kind, name, ds, style) in curves], targets)
+    for ((kind, name, ds, style), evals) in zip(curves, allevals):
         #print name, ds
-        fevs1 = groupby(ds.detEvals(targets), axis=1)
+        fevs1 = groupby(evals, axis=1)
         if baseline1_ds:
             fevs1 /= baseline1_fevs
-        fevs2 = groupby(ds.detEvals(targets), axis=1)
+        fevs2 = groupby(evals, axis=1)
         if baseline2_ds:
             fevs2 /= baseline2_fevs
 
-        infsx = np.nonzero(fevs1 == inf)
+        infsx = np.nonzero(fevs1 == np.inf)
         infs = infsx[0]
         if np.size(infs) > 0:
             #print infs
@@ -22,18 +22,30 @@ compounded with portfolios and we thus further de-emphasize statistical
 estimates of unobserved ERTs.
 """
 
+import collections
+import copy
+import hashlib
 import itertools
+import json
+import multiprocessing
 import numpy as np
+import os
 import pickle, gzip
 import re
-import scipy.stats as ss
+import shutil
 import sys
+import time
 
 sys.path.append('.')
-import bbob_pproc as bb
-import bbob_pproc.algportfolio
-import bbob_pproc.bestalg
-import bbob_pproc.readalign as ra
+from cocopf.lazy import LazyModule
+
+# The COCO post-processing stack is slow to import;
+# unpickling PortfolioDataSets imports bbob_pproc on its own anyway.
+bb = LazyModule('bbob_pproc')
+bb_algportfolio = LazyModule('bbob_pproc.algportfolio')
+bb_bestalg = LazyModule('bbob_pproc.bestalg')
+bb_pproc = LazyModule('bbob_pproc.pproc')
+ra = LazyModule('bbob_pproc.readalign')
 
 
 class PortfolioDataSets:
@@ -65,22 +77,36 @@ class PortfolioDataSets:
         """
         Initialize the portfolio dataset container; pass dicts
         of DataSetLists (e.g. returned by bb.load()). Alternatively,
-        we can unpickle an existing portfolio.
+        we can unpickle an existing portfolio, or open one stored
+        by save() if pickleFile is a directory.  Strategies appended
+        by append_strategy() are included.
         """
+        self._index_reset()
         if pickleFile is None:
             self.algds = algorithms
             self.stratds = strategies
             self._bestalg = None
             self._unifpf = None
+            self._oracle = dict()
+        elif os.path.isdir(pickleFile):
+            self._load_columnar(pickleFile)
         else:
             if pickleFile.find('.gz') < 0:
                 pickleFile += '.gz'
             with gzip.open(pickleFile) as f:
                 entry = pickle.load(f)
-            self.algds = entry.algds
-            self.stratds = entry.stratds
-            self._bestalg = entry._bestalg
-            self._unifpf = entry._unifpf
+                self.algds = entry.algds
+                self.stratds = entry.stratds
+                self._bestalg = entry._bestalg
+                self._unifpf = entry._unifpf
+                self._oracle = getattr(entry, '_oracle', dict())
+                # Segments added by append_strategy()
+                while True:
+                    try:
+                        (kind, name, ds) = pickle.load(f)
+                    except EOFError:
+                        break
+                    self.add_strategy(name, ds)
 
     def add_algorithm(self, name, ds):
         """
@@ -88,13 +114,60 @@ class PortfolioDataSets:
         """
         self.algds[name] = ds
         self._bestalg = None
-        self._unfipf = None
+        self._unifpf = None
+        self._oracle = dict()
+        self._index_reset()
 
     def add_strategy(self, name, ds):
         """
         Add another strategy.
         """
         self.stratds[name] = ds
+        self._index_reset()
+
+    def _index_reset(self):
+        # (kind, dim, funcId) -> [(name, DataSet), ...], see _dimfunc_index()
+        self._index = dict()
+        # kind -> [(name, dset.dictByDimFunc()), ...]
+        self._dbdf = None
+
+    def _dimfunc_index(self, kind, dimfun):
+        """
+        Return a list of (name, DataSet) tuples of the given kind
+        ('algds', 'stratds' or 'unifpf') for the given dimfun.
+        dictByDimFunc() rebuilds a dict from the whole DataSetList,
+        so we call it just once per DataSetList and remember the
+        results per dimfun.
+        """
+        key = (kind,) + tuple(dimfun)
+        try:
+            return self._index[key]
+        except KeyError:
+            pass
+
+        if self._dbdf is None:
+            self._dbdf = dict(
+                    algds=[(name, dset.dictByDimFunc()) for (name, dset) in self.algds.iteritems()],
+                    stratds=[(name, dset.dictByDimFunc()) for (name, dset) in self.stratds.iteritems()],
+                )
+        if kind == 'unifpf' and 'unifpf' not in self._dbdf:
+            self._dbdf['unifpf'] = [('eUNIF', self.unifpf().dictByDimFunc())]
+
+        (dim, funcId) = dimfun
+        nameds = [(name, dbdf[dim][funcId][0]) for (name, dbdf) in self._dbdf[kind]]
+        self._index[key] = nameds
+        return nameds
+
+    def __getstate__(self):
+        # Do not pickle the index
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        state.pop('_dbdf', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index_reset()
 
     def bestalg(self, dimfun):
         """
@@ -109,7 +182,7 @@ class PortfolioDataSets:
         which take only reached targets but not required budgets into account.
         """
         if self._bestalg is None:
-            self._bestalg = bb.bestalg.generate(self.algds)
+            self._bestalg = bb_bestalg.generate(self.algds)
         return self._bestalg[dimfun] if dimfun is not None else self._bestalg
 
     def oracle(self, dimfun):
@@ -124,30 +197,52 @@ class PortfolioDataSets:
         since it can switch between algorithms "for free" while the target
         moves ahead.
         """
-        (dim, funcId) = dimfun
+        (name, medevals) = self.oracle_choice(dimfun)
+        return self.alg_dimfunc(name, dimfun)
+
+    def oracle_choice(self, dimfun):
+        """
+        Return a (name, medevals) tuple for the given dimfun, where name
+        is the algorithm picked by oracle() and medevals is a dict with
+        the median number of evaluations each algorithm needed to reach
+        the best reachable target (the maximum budget if it did not).
+
+        The choices are remembered and stored with the portfolio.
+        """
+        dimfun = tuple(dimfun)
+        try:
+            return self._oracle[dimfun]
+        except KeyError:
+            pass
 
         # What is the best reachable target?
         bestfinalfunval = max(np.median(self.bestalg(dimfun).bestfinalfunvals), 1e-8)
 
         # How fast do various algorithms reach it?
-        algs = list(self.algds_dimfunc(dimfun))
+        algs = self._dimfunc_index('algds', dimfun)
         maxevals = np.max([ds.maxevals for (name, ds) in algs])
-        evals = np.array([ds.detEvals([bestfinalfunval]) for (name, ds) in algs])
-
-        # XXX: Gah, how to do this the numpy way?
-        nanmask = np.isnan(evals)
-        medevals = [maxevals]*len(algs)
-        for i in range(len(algs)):
-            algnanmask = ~np.isnan(evals)[i]
-            if np.any(algnanmask):
-                medevals[i] = np.median(evals[i, algnanmask])
-            else:
-                medevals[i] = maxevals
-        nametarget = [(algs[i][0], medevals[i]) for i in range(len(algs))]
+        evals = np.array([np.ravel(ds.detEvals([bestfinalfunval])) for (name, ds) in algs])
+        # Median over the instances that did reach it
+        medevals = np.ma.median(np.ma.masked_invalid(evals), axis=1).filled(maxevals)
 
         # Pick the fastest!
-        (name, target) = min(nametarget, key = lambda k: k[1])
-        return self.algds[name].dictByDimFunc()[dim][funcId][0]
+        choice = (algs[np.argmin(medevals)][0],
+                  dict([(algs[i][0], float(medevals[i])) for i in range(len(algs))]))
+        self._oracle[dimfun] = choice
+        return choice
+
+    def oracle_table(self):
+        """
+        Determine the oracle choices for all dimfuns at once, returning
+        a dict mapping dimfun to oracle_choice() results.  Dimfuns that
+        some of the algorithms have no data for are skipped.
+        """
+        for dimfun in self.bestalg(None).keys():
+            try:
+                self.oracle_choice(dimfun)
+            except KeyError:
+                continue # missing in _dimfunc_index()
+        return self._oracle
 
     def unifpf(self):
         """
@@ -157,9 +252,15 @@ class PortfolioDataSets:
         each algorithm after each function evaluation.
         """
         if self._unifpf is None:
-            self._unifpf = bb.algportfolio.build(self.algds)
+            self._unifpf = bb_algportfolio.build(self.algds)
         return self._unifpf
 
+    def unifpf_dimfunc(self, dimfun):
+        """
+        Return the DataSet of the uniform portfolio for the given dimfun.
+        """
+        return self._dimfunc_index('unifpf', dimfun)[0][1]
+
     def pickle(self, pickleFile):
         """
         Pickle the current portfolio dataset.  The file is automatically
@@ -169,29 +270,93 @@ class PortfolioDataSets:
         stuff in different ways), therefore even redundant information like
         best and eUNIF are stored.  An alternative mode pickling only bare
         minimum (aimed at redistribution) will come in the future.
+
+        The file is replaced atomically.  To add just a strategy to
+        an existing file, append_strategy() is much faster.
         """
         if pickleFile.find('.gz') < 0:
             pickleFile += '.gz'
-        with gzip.open(pickleFile, 'w') as f:
+        tmpFile = pickleFile + '.tmp'
+        with gzip.open(tmpFile, 'w') as f:
             pickle.dump(self, f)
+        os.rename(tmpFile, pickleFile)
+
+    def save(self, path):
+        """
+        Store the current portfolio dataset in a columnar format: ``path``
+        is a directory with a subdirectory per dataset (algorithm, strategy,
+        best and eUNIF, each split by dim-funcId) that holds its NumPy
+        arrays as .npy files and the remaining attributes pickled, plus
+        an index.json listing it all.
+
+        Unlike pickle(), opening the result (pass ``path`` as pickleFile)
+        is nearly instant; each (dim, funcId) of a dataset is loaded only
+        when accessed, with the arrays memory-mapped.  Like pickle(),
+        best and eUNIF are computed and stored too.
+        """
+        tmppath = path.rstrip('/') + '.tmp'
+        if os.path.exists(tmppath):
+            shutil.rmtree(tmppath)
+        os.makedirs(tmppath)
+
+        index = dict(version=1, algorithms={}, strategies={})
+        for (kind, dsets) in [('algorithms', self.algds), ('strategies', self.stratds)]:
+            for (name, dsl) in dsets.iteritems():
+                index[kind][name] = _dsl_save(dsl, os.path.join(tmppath, kind, name))
+        index['unifpf'] = _dsl_save(self.unifpf(), os.path.join(tmppath, 'unifpf'))
+        bestalg = self.bestalg(None)
+        for (dimfun, ds) in bestalg.iteritems():
+            _ds_save(ds, os.path.join(tmppath, 'bestalg', '%d-%d' % dimfun))
+        index['bestalg'] = sorted(bestalg.keys())
+        index['oracle'] = [[dim, funcId, name, medevals]
+                           for ((dim, funcId), (name, medevals)) in sorted(self.oracle_table().items())]
+
+        _index_write(tmppath, index)
+
+        # Swap the new copy in place of the old one
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmppath, path)
+
+    def _load_columnar(self, path):
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        def dsls(kind):
+            return dict([(str(name), ColumnarDataSetList(os.path.join(path, kind, name), dimfuns))
+                         for (name, dimfuns) in index[kind].iteritems()])
+        self.algds = dsls('algorithms')
+        self.stratds = dsls('strategies')
+        self._unifpf = ColumnarDataSetList(os.path.join(path, 'unifpf'), index['unifpf'])
+        self._bestalg = _LazyDict([tuple(dimfun) for dimfun in index['bestalg']],
+                                  lambda dimfun: _ds_load(os.path.join(path, 'bestalg', '%d-%d' % dimfun)))
+        self._oracle = dict([((dim, funcId), (str(name), dict([(str(k), v) for (k, v) in medevals.iteritems()])))
+                             for (dim, funcId, name, medevals) in index.get('oracle', [])])
 
     def algds_dimfunc(self, dimfun):
         """
         Return an iterable of (name, DataSet) tuples corresponding
         to the given dimfun.
         """
-        (dim, funcId) = dimfun
-        for (algname, dset) in self.algds.iteritems():
-            yield (algname, dset.dictByDimFunc()[dim][funcId][0])
+        return iter(self._dimfunc_index('algds', dimfun))
 
     def stratds_dimfunc(self, dimfun):
         """
         Return an iterable of (name, DataSet) tuples corresponding
         to the given dimfun.
         """
-        (dim, funcId) = dimfun
-        for (stratname, dset) in self.stratds.iteritems():
-            yield (stratname, dset.dictByDimFunc()[dim][funcId][0])
+        return iter(self._dimfunc_index('stratds', dimfun))
+
+    def alg_dimfunc(self, name, dimfun):
+        """
+        Return the DataSet of algorithm ``name`` for the given dimfun.
+        """
+        return dict(self._dimfunc_index('algds', dimfun))[name]
+
+    def strat_dimfunc(self, name, dimfun):
+        """
+        Return the DataSet of strategy ``name`` for the given dimfun.
+        """
+        return dict(self._dimfunc_index('stratds', dimfun))[name]
 
     def maxevals(self, dimfun):
         """
@@ -215,41 +380,431 @@ class PortfolioDataSets:
         a particular budget.  If multiple algorithms reach ftarget,
         they are ranked by the order in which they did.
         """
-        nameds = list(itertools.chain(self.algds_dimfunc(dimfun), self.stratds_dimfunc(dimfun)))
-        count = len(nameds)
+        fva = ra.alignArrayData(ra.VArrayMultiReader(self._fvset(dimfun, groupby, ftarget)))
+        budgets = fva[:,0]
+        ranks = _rank_converging(fva[:,1:], ftarget)
+        return np.transpose(np.vstack([budgets, ranks.T]))
+
+    def ranking_batch(self, dim, funcIds, groupby, ftarget=10**-8):
+        """
+        Like ranking(), but for a list of funcIds at once; the budgets
+        of all functions are aligned together.
+
+        Returns a (budgets, ranks) tuple where ranks is a 3-D array
+        indexed by [funcId index, budget index, algorithm/strategy].
+        """
+        fvset = []
+        for funcId in funcIds:
+            fvset += self._fvset((dim, funcId), groupby, ftarget)
+        fva = ra.alignArrayData(ra.VArrayMultiReader(fvset))
+        budgets = fva[:,0]
+        # (budget, funcId * count) -> (funcId, budget, count)
+        values = fva[:,1:].reshape((len(budgets), len(funcIds), -1)).swapaxes(0, 1)
+        return (budgets, _rank_converging(values, ftarget))
 
-        # Produce "fv" items, one per dataset, containing single function value
-        # for each budget
+    def _fvset(self, dimfun, groupby, ftarget):
+        """
+        Produce "fv" items, one per dataset, containing single function
+        value for each budget.
+        """
         fvset = []
-        for (name, ds) in nameds:
+        for (name, ds) in itertools.chain(self.algds_dimfunc(dimfun), self.stratds_dimfunc(dimfun)):
             budgets = ds.funvals[:,0]
             f1vals = np.maximum(groupby(ds.funvals[:, 1:], axis=1), ftarget)
             fv = np.transpose(np.vstack([budgets, f1vals]))
             fvset.append(fv)
+        return fvset
 
-        # Align the "fv" items by budget and merge them
-        fva = ra.alignArrayData(ra.VArrayMultiReader(fvset))
-        budgets = fva[:,0]
 
-        # Assign function values and rank them
-        # However, we want to resolve eventual ties by ranking first
-        # converging function first. So we do a trick and rewrite ftarget
-        # values in increasing convergence sort order.
-        values = fva[:,1:].copy()
-        firstconv = np.ones(count) * (np.size(budgets)+1) # runlength+1 is default
-        for i in range(count): # XXX: drop the loop
+def _rank_converging(values, ftarget):
+    """
+    Rank function values in the last axis of ``values``, with budgets
+    along the second to last axis.
+
+    Values are ranked at each budget, but we want to resolve eventual
+    ties by ranking first converging function first.  So we do a trick
+    and rewrite ftarget values in increasing convergence sort order.
+    """
+    (nbudgets, count) = np.shape(values)[-2:]
+    conv = values == ftarget
+    # runlength+1 is default (no rewriting needed)
+    firstconv = np.where(np.any(conv, axis=-2), np.argmax(conv, axis=-2), nbudgets+1)
+    firstconvranks = rankdata(firstconv)
+    rewrite = np.arange(nbudgets)[:, np.newaxis] >= firstconv[..., np.newaxis, :]
+    convvalues = ftarget - (1-firstconvranks/count)*ftarget
+    values = np.where(rewrite, convvalues[..., np.newaxis, :], values)
+    return rankdata(values)
+
+def rankdata(a):
+    """
+    Rank values along the last axis of ``a`` starting from 1, assigning
+    tied values the average of their ranks, like scipy.stats.rankdata()
+    but for all the other axes at once.  NaN values are ranked last
+    (each on its own, in the order of appearance), as they were by
+    scipy.stats.mstats.rankdata().
+    """
+    a = np.asarray(a, dtype=float)
+    shape = np.shape(a)
+    n = shape[-1]
+    a = a.reshape((int(np.prod(shape[:-1])), n))
+    rows = np.arange(len(a))[:, np.newaxis]
+    # A stable sort keeps NaNs (sorted last) in their order
+    order = np.argsort(a, axis=-1, kind='mergesort')
+    s = a[rows, order]
+    # Mark the beginning of each run of equal values (NaNs never compare
+    # equal) and give each run the average of its positions
+    start = np.ones(np.shape(s), dtype=bool)
+    start[:, 1:] = s[:, 1:] != s[:, :-1]
+    run = np.cumsum(start.ravel()) - 1
+    pos = np.tile(np.arange(n), len(a))
+    runranks = pos[start.ravel()] + (np.bincount(run) - 1) / 2. + 1
+    ranks = np.empty(np.shape(a))
+    ranks[rows, order] = runranks[run].reshape(np.shape(a))
+    return ranks.reshape(shape)
+
+class DetEvalsCache(object):
+    """
+    A memoization layer for DataSet.detEvals() with LRU eviction
+    of the least recently used of the ``maxsize`` entries.  Entries
+    are keyed by the dataset identity and a hash of the targets.
+
+    The results of plain DataSets are returned as read-only 2-D
+    arrays (targets by runs), computed by a vectorized lookup of all
+    the targets; results of other objects (like BestAlgSet) are
+    returned as their detEvals() returns them.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, ds, targets):
+        targets = np.ascontiguousarray(targets, dtype=float)
+        return (id(ds), len(targets), hashlib.sha1(targets.tostring()).hexdigest())
+
+    def _get(self, key):
+        (ds, evals) = self.entries.pop(key)
+        self.entries[key] = (ds, evals) # most recently used
+        return evals
+
+    def _put(self, key, ds, evals):
+        # Keeping the reference to ds ensures its id() is not reused
+        self.entries[key] = (ds, evals)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def det_evals(self, ds, targets):
+        """
+        Return ds.detEvals(targets).
+        """
+        return self.det_evals_batch([ds], targets)[0]
+
+    def det_evals_batch(self, datasets, targets):
+        """
+        Return a list of ds.detEvals(targets) for each ds in datasets
+        (e.g. all datasets of a single dimfun).  The targets are
+        prepared for lookup just once for all the datasets.
+        """
+        keys = [self._key(ds, targets) for ds in datasets]
+        results = [None] * len(datasets)
+        missing = []
+        for (i, key) in enumerate(keys):
+            if key in self.entries:
+                results[i] = self._get(key)
+                self.hits += 1
+            else:
+                missing.append(i)
+                self.misses += 1
+
+        if missing:
+            targets = list(targets)
+            negtargets = -np.asarray(targets, dtype=float)
+            for i in missing:
+                ds = datasets[i]
+                if _plain_det_evals(ds):
+                    evals = _det_evals_sorted(ds.evals, negtargets)
+                    evals.setflags(write=False)
+                else:
+                    evals = ds.detEvals(targets)
+                results[i] = evals
+                self._put(keys[i], ds, evals)
+        return results
+
+def _plain_det_evals(ds):
+    """
+    Whether ds.detEvals() is the stock DataSet.detEvals().
+    """
+    method = getattr(ds.__class__, 'detEvals', None)
+    return (getattr(method, 'im_func', None) is bb_pproc.DataSet.detEvals.im_func
+            and isinstance(getattr(ds, 'evals', None), np.ndarray))
+
+def _det_evals_sorted(evals, negtargets):
+    """
+    Vectorized DataSet.detEvals(): for each target, pick the runs'
+    evaluations in the first row of ``evals`` whose target is not
+    above the target (or NaNs if there is no such row).  The rows
+    are sorted by decreasing target, so -target is increasing and
+    the row is found by binary search.
+    """
+    rowidx = np.searchsorted(-evals[:, 0], negtargets, side='left')
+    rows = np.vstack([evals[:, 1:], np.nan * np.ones((1, np.shape(evals)[1] - 1))])
+    return rows[rowidx]
+
+# The shared cache used by pplot and the pptools
+detevals_cache = DetEvalsCache()
+
+def det_evals(ds, targets):
+    """
+    A memoized ds.detEvals(targets), see DetEvalsCache.
+    """
+    return detevals_cache.det_evals(ds, targets)
+
+def det_evals_batch(datasets, targets):
+    """
+    A memoized ds.detEvals(targets) of each of the datasets,
+    see DetEvalsCache.
+    """
+    return detevals_cache.det_evals_batch(datasets, targets)
+
+
+def append_strategy(pickleFile, name, ds):
+    """
+    Add strategy ``name`` with DataSetList ``ds`` to a portfolio dataset
+    stored by PortfolioDataSets.pickle() or save() (if pickleFile is
+    a directory), without loading it.  As strategies do not affect
+    the best and eUNIF data, the stored portfolio stays consistent.
+    A strategy of the same name is replaced.
+
+    In a pickle, the strategy is stored as an extra gzip member (with
+    a ('strategy', name, ds) tuple) appended to a copy of the file,
+    which then atomically replaces the original.
+    """
+    if os.path.isdir(pickleFile):
+        return _columnar_append_strategy(pickleFile, name, ds)
+
+    if pickleFile.find('.gz') < 0:
+        pickleFile += '.gz'
+    tmpFile = pickleFile + '.tmp'
+    shutil.copyfile(pickleFile, tmpFile)
+    with open(tmpFile, 'ab') as rawf:
+        with gzip.GzipFile(fileobj=rawf, mode='wb') as f:
+            pickle.dump(('strategy', name, ds), f)
+        rawf.flush()
+        os.fsync(rawf.fileno())
+    os.rename(tmpFile, pickleFile)
+
+def _columnar_append_strategy(path, name, ds):
+    sdir = os.path.join(path, 'strategies', name)
+    tmpdir = sdir + '.tmp'
+    olddir = sdir + '.old'
+    for d in [tmpdir, olddir]:
+        if os.path.exists(d):
+            shutil.rmtree(d)
+    dimfuns = _dsl_save(ds, tmpdir)
+
+    if os.path.exists(sdir):
+        os.rename(sdir, olddir)
+    os.rename(tmpdir, sdir)
+    with open(os.path.join(path, 'index.json')) as f:
+        index = json.load(f)
+    index['strategies'][name] = dimfuns
+    _index_write(path, index)
+    if os.path.exists(olddir):
+        shutil.rmtree(olddir)
+
+def _index_write(path, index):
+    tmpFile = os.path.join(path, 'index.json.tmp')
+    with open(tmpFile, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.rename(tmpFile, os.path.join(path, 'index.json'))
+
+
+class _LazyDict(dict):
+    """
+    A dict with a fixed set of keys whose values are produced by
+    ``loader(key)`` when first accessed.
+    """
+    def __init__(self, keys, loader):
+        dict.__init__(self, [(k, None) for k in keys])
+        self._loader = loader
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if value is None:
+            value = self._loader(key)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def itervalues(self):
+        for k in self.iterkeys():
+            yield self[k]
+
+    def iteritems(self):
+        for k in self.iterkeys():
+            yield (k, self[k])
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __reduce__(self):
+        return (dict, (self.items(),))
+
+
+class ColumnarDataSetList(object):
+    """
+    A DataSetList stored by PortfolioDataSets.save() in directory ``path``;
+    the DataSet of each (dim, funcId) pair listed in ``dimfuns`` is loaded
+    only when it is first accessed via dictByDimFunc() (the way
+    PortfolioDataSets accesses data).  Any other DataSetList method
+    loads all the data sets and is performed on a real DataSetList.
+    """
+    def __init__(self, path, dimfuns):
+        self.path = path
+        self.dimfuns = [tuple(dimfun) for dimfun in dimfuns]
+        self._datasets = _LazyDict(self.dimfuns, self._load_dimfun)
+        self._dsl = None
+
+    def _load_dimfun(self, dimfun):
+        return _ds_load(os.path.join(self.path, '%d-%d' % dimfun))
+
+    def dictByDimFunc(self):
+        dimfuns = dict()
+        for (dim, funcId) in self.dimfuns:
+            dimfuns.setdefault(dim, []).append(funcId)
+        return dict([(dim, _LazyDict(funcIds, lambda funcId, dim=dim: [self._datasets[(dim, funcId)]]))
+                     for (dim, funcIds) in dimfuns.iteritems()])
+
+    def load(self):
+        """
+        Return a real DataSetList with all the data sets.
+        """
+        if self._dsl is None:
+            self._dsl = bb_pproc.DataSetList()
+            list.extend(self._dsl, self._datasets.values())
+        return self._dsl
+
+    def __iter__(self):
+        return self._datasets.itervalues()
+
+    def __len__(self):
+        return len(self.dimfuns)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __reduce_ex__(self, protocol):
+        # Pickle as a plain DataSetList
+        return self.load().__reduce_ex__(protocol)
+
+
+def _ds_save(ds, path):
+    """
+    Store a single DataSet (or BestAlgSet) in directory ``path``: its
+    numeric NumPy array attributes go to .npy files, the rest is pickled.
+    """
+    os.makedirs(path)
+    rest = copy.copy(ds)
+    for (attr, value) in ds.__dict__.items():
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            np.save(os.path.join(path, attr + '.npy'), value)
+            delattr(rest, attr)
+    with open(os.path.join(path, 'attrs.pickle'), 'wb') as f:
+        pickle.dump(rest, f, pickle.HIGHEST_PROTOCOL)
+
+def _ds_load(path):
+    with open(os.path.join(path, 'attrs.pickle'), 'rb') as f:
+        ds = pickle.load(f)
+    for fname in os.listdir(path):
+        if fname.endswith('.npy'):
+            fpath = os.path.join(path, fname)
             try:
-                firstconv[i] = np.nonzero(values[:,i] == ftarget)[0][0]
-            except IndexError:
-                continue # no rewriting needed
-        firstconvranks = ss.mstats.rankdata(firstconv)
-        for i in range(count):
-            r = firstconvranks[i]
-            values[firstconv[i]:, i] = ftarget - (1-r/count)*ftarget
+                # Copy-on-write so that in-place updates do not reach the file
+                value = np.load(fpath, mmap_mode='c')
+            except ValueError: # empty arrays cannot be mapped
+                value = np.load(fpath)
+            setattr(ds, fname[:-4], value)
+    return ds
+
+def _dsl_save(dsl, path):
+    """
+    Store a DataSetList in directory ``path``, returning the list
+    of its (dim, funcId) pairs.
+    """
+    dimfuns = []
+    for ds in dsl:
+        dimfun = (ds.dim, ds.funcId)
+        _ds_save(ds, os.path.join(path, '%d-%d' % dimfun))
+        dimfuns.append(dimfun)
+    return dimfuns
 
-        ranks = ss.mstats.rankdata(values, axis=1)
 
-        return np.transpose(np.vstack([budgets, ranks.T]))
+def load_datasets(infofiles, workers=None):
+    """
+    Load many DataSetLists in parallel; ``infofiles`` is a list
+    of (name, [.info filename, ...]) tuples, the result is a list
+    of (name, DataSetList) tuples, each equivalent to bb.load()
+    of the respective files.
+
+    The .info files are parsed by a pool of ``workers`` processes
+    (by default, one per CPU).  A line with timing information is
+    printed as loading of each name completes.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    tasks = [(i, j, fname) for (i, (name, fnames)) in enumerate(infofiles)
+                           for (j, fname) in enumerate(fnames)]
+    # Biggest files first so that they do not straggle at the end
+    tasks.sort(key=lambda (i, j, fname): -os.path.getsize(fname))
+
+    t0 = time.time()
+    parts = [[None] * len(fnames) for (name, fnames) in infofiles]
+    pending = [len(fnames) for (name, fnames) in infofiles]
+    cputime = [0.] * len(infofiles)
+    results = [None] * len(infofiles)
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        loaded = pool.imap_unordered(_load_info, tasks)
+    else:
+        pool = None
+        loaded = itertools.imap(_load_info, tasks)
+    for (i, j, dsl, t) in loaded:
+        parts[i][j] = dsl
+        pending[i] -= 1
+        cputime[i] += t
+        if pending[i] == 0:
+            # Merge in bb.load() order so that instances of the same
+            # (algorithm, dim, funcId) are joined the same way
+            results[i] = bb_pproc.DataSetList()
+            for part in parts[i]:
+                for ds in part:
+                    results[i].append(ds)
+            parts[i] = None
+            print '%s: %d files, %.1fs parsing, done at %.1fs' % (
+                    infofiles[i][0], len(infofiles[i][1]), cputime[i], time.time() - t0)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    for (i, (name, fnames)) in enumerate(infofiles):
+        if results[i] is None: # no files at all
+            results[i] = bb_pproc.DataSetList()
+    return [(name, results[i]) for (i, (name, fnames)) in enumerate(infofiles)]
+
+def _load_info(task):
+    (i, j, fname) = task
+    t0 = time.time()
+    dsl = bb.load([fname])
+    return (i, j, dsl, time.time() - t0)
 
 
 def resolve_fid(fid):
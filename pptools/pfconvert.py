@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Convert a portfolio data pickle produced by pfpickle.py to the columnar
+directory format (see PortfolioDataSets.save()), which the other pptools
+load much faster - pass the directory instead of the pickle file.
+
+Usage: pfconvert.py PICKLEFILE DIRECTORY
+"""
+
+import os
+import sys
+import time
+
+# Add the path to bbob_pproc and cocopf
+if __name__ == "__main__":
+    (filepath, filename) = os.path.split(sys.argv[0])
+    sys.path.append(os.path.join(filepath, os.path.pardir, os.path.pardir))
+
+from cocopf.pproc import PortfolioDataSets
+
+picklefile = sys.argv[1]
+directory = sys.argv[2]
+
+t0 = time.time()
+print "Loading..."
+pds = PortfolioDataSets(pickleFile=picklefile)
+t1 = time.time()
+print "Saving..."
+pds.save(directory)
+t2 = time.time()
+print "Loaded in %.1fs, saved in %.1fs" % (t1 - t0, t2 - t1)
@@ -7,11 +7,19 @@ given set of strategies, compute the oracle and uniform portfolio
 strategy and pickle the resulting portfolio data so that it can
 be quickly used for various plotting activities.
 
-Usage: pickle.py PICKLEFILE ALGORITHM... -- STRATEGY...
+Usage: pickle.py [-j WORKERS] PICKLEFILE ALGORITHM... -- STRATEGY...
 
 Note that if PICKLEFILE already exists, the given datasets are appended
 to the data file.  If you specify datasets by path, only the basename
 is used as the algorithm/strategy name in portfolio.
+
+When only strategies are being added (no ALGORITHM is given), they are
+appended to PICKLEFILE without loading it, which is much faster.
+PICKLEFILE may also be a directory in the columnar format (see
+pfconvert.py).
+
+The datasets are loaded by WORKERS processes in parallel (one per CPU
+by default).
 """
 
 import glob
@@ -23,35 +31,59 @@ if __name__ == "__main__":
     (filepath, filename) = os.path.split(sys.argv[0])
     sys.path.append(os.path.join(filepath, os.path.pardir, os.path.pardir))
 
-import bbob_pproc as bb
-from cocopf.pproc import PortfolioDataSets
+from cocopf.pproc import PortfolioDataSets, append_strategy, load_datasets
 
+if sys.argv[1] == '-j':
+    sys.argv.pop(1)
+    workers = int(sys.argv.pop(1))
+else:
+    workers = None
 picklefile = sys.argv[1]
 
 dashidx = sys.argv.index('--')
 algs = sys.argv[2:dashidx]
 strats = sys.argv[dashidx+1:]
 
-if os.path.exists(picklefile) or os.path.exists(picklefile + '.gz'):
+def infofiles(paths, patterns):
+    return [(os.path.basename(os.path.normpath(path)),
+             sum([glob.glob(path+pattern) for pattern in patterns], []))
+            for path in paths]
+
+algfiles = infofiles(algs, ['/bbobexp_f*.info'])
+stratfiles = infofiles(strats, ['/bbobexp_f*.info', '/*/bbobexp_f*.info'])
+
+exists = os.path.exists(picklefile) or os.path.exists(picklefile + '.gz')
+
+if exists and not algs:
+    # New strategies do not change bestalg and unifpf, so there is no
+    # need to load and rewrite the whole thing
+    for (sname, ds) in load_datasets(stratfiles, workers):
+        print "Appending " + sname
+        append_strategy(picklefile, sname, ds)
+    sys.exit(0)
+
+if exists:
     pds = PortfolioDataSets(pickleFile=picklefile)
 else:
     pds = PortfolioDataSets()
 
-for apath in algs:
-    print apath
-    aname = os.path.basename(os.path.normpath(apath))
-    pds.add_algorithm(aname, bb.load(glob.glob(apath+'/bbobexp_f*.info')))
-for spath in strats:
-    print spath
-    sname = os.path.basename(os.path.normpath(spath))
-    pds.add_strategy(sname, bb.load(glob.glob(spath+'/bbobexp_f*.info') + glob.glob(spath+'/*/bbobexp_f*.info')))
+loaded = load_datasets(algfiles + stratfiles, workers)
+for (aname, ds) in loaded[:len(algfiles)]:
+    pds.add_algorithm(aname, ds)
+for (sname, ds) in loaded[len(algfiles):]:
+    pds.add_strategy(sname, ds)
 
 # TODO: Make generating these optional?
 print "bestalg"
 pds.bestalg(None)
 print "unifpf"
 pds.unifpf()
+print "oracle"
+pds.oracle_table()
 
-# TODO: Pickle to tmp file and rename()?
-print "Pickling..."
-pds.pickle(picklefile)
+if os.path.isdir(picklefile):
+    print "Saving..."
+    pds.save(picklefile)
+else:
+    print "Pickling..."
+    pds.pickle(picklefile)
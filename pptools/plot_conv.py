@@ -4,7 +4,7 @@
 """
 Plot convergence data of a portfolio on a given set of functions.
 
-Usage: plot_conv.py [-o FILE.PDF] PICKLEFILE PLOTTYPE DIM FID...
+Usage: plot_conv.py [-o FILE.PDF [-j WORKERS]] PICKLEFILE PLOTTYPE DIM FID...
 
 For now, see the plot_by_type() function for various options regarding
 what PLOTTYPE can be.  Get started with fval_by_budget or overview.
@@ -14,14 +14,21 @@ types. "overview0" will always refer to the current layout.)
 
 In case of PLOTTYPE "rank_by_budget", FID may be multiple comma-separated
 functions that will be averaged.
+
+With -j, the figures (pages of FILE.PDF) are rendered by WORKERS
+processes in parallel and then merged using PyPDF2 if installed,
+or the pdfunite tool otherwise.
 """
 
+import multiprocessing
 import os
 import re
+import shutil
+import subprocess
 import sys
+import tempfile
 import time
-from pylab import *
-from matplotlib.backends.backend_pdf import PdfPages
+import numpy as np
 
 # Add the path to bbob_pproc and cocopf
 if __name__ == "__main__":
@@ -30,6 +37,7 @@ if __name__ == "__main__":
 
 from cocopf.pproc import PortfolioDataSets, resolve_fid
 import cocopf.pplot as cplot
+from cocopf.pplot import plt
 
 
 def get_stratds(pds, strat, dim, fid):
@@ -38,7 +46,7 @@ def get_stratds(pds, strat, dim, fid):
     elif strat == 'envelope':
         return pds.bestalg((dim, fid))
     else:
-        return pds.stratds[strat].dictByDimFunc()[dim][fid][0]
+        return pds.strat_dimfunc(strat, (dim, fid))
 
 
 def plot_by_type(pds, ax, plottype, dim, fid):
@@ -95,7 +103,7 @@ def fig_by_type(pds, plottype, dim, fid):
     if plottype == "overview" or plottype == "overview0":
         return fig_overview(pds, dim, fid)
 
-    fig = figure('%s (%s)'%(fid, plottype))
+    fig = plt.figure('%s (%s)'%(fid, plottype))
     ax = fig.add_subplot(111)
     plot_by_type(pds, ax, plottype, dim, fid)
     fig.text(0.9, 0.2, 'F'+fid, horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
@@ -104,7 +112,7 @@ def fig_by_type(pds, plottype, dim, fid):
 
 
 def fig_overview(pds, dim, fid):
-    fig = figure('%s (overview)'%(fid))
+    fig = plt.figure('%s (overview)'%(fid))
     fig.text(0.5, 0.5, 'Function '+fid, horizontalalignment='center', verticalalignment='center')
     subplots = []
     # Also potentially interesting (but hard to comprehend):
@@ -118,10 +126,80 @@ def fig_overview(pds, dim, fid):
     return fig
 
 
+def fig_page(pds, plottype, dim, fid):
+    print 'figure', plottype, dim, fid
+    fig = fig_by_type(pds, plottype, dim, fid)
+    fig.set_size_inches((11.692, 8.267)) # A4 landscape
+    fig.set_tight_layout(True)
+    return fig
+
+
+def plot_pdf(pds, plottype, dim, fids, pdffile, workers=1):
+    """
+    Render a page per fid into pdffile, using ``workers`` processes.
+    """
+    if workers > 1:
+        return render_parallel(pds, plottype, dim, fids, pdffile, workers)
+    from matplotlib.backends.backend_pdf import PdfPages
+    pdf = PdfPages(pdffile)
+    for fid in fids:
+        fig = fig_page(pds, plottype, dim, fid)
+        pdf.savefig(fig)
+        plt.close(fig)
+    pdf.close()
+
+
+# Set up before forking the rendering workers
+_job = None
+
+def _render_page(task):
+    (i, fid) = task
+    (pds, plottype, dim, tmpdir) = _job
+    fig = fig_page(pds, plottype, dim, fid)
+    pagefile = os.path.join(tmpdir, '%04d.pdf' % i)
+    fig.savefig(pagefile, format='pdf')
+    plt.close(fig)
+    return pagefile
+
+def render_parallel(pds, plottype, dim, fids, pdffile, workers):
+    """
+    Render a page per fid in parallel and merge the pages into pdffile.
+    """
+    global _job
+    tmpdir = tempfile.mkdtemp(prefix='plot_conv')
+    try:
+        _job = (pds, plottype, dim, tmpdir)
+        pool = multiprocessing.Pool(workers)
+        pagefiles = pool.map(_render_page, list(enumerate(fids)), chunksize=1)
+        pool.close()
+        pool.join()
+        merge_pdfs(pagefiles, pdffile)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def merge_pdfs(pdffiles, outfile):
+    try:
+        from PyPDF2 import PdfFileMerger
+    except ImportError:
+        subprocess.check_call(['pdfunite'] + pdffiles + [outfile])
+        return
+    merger = PdfFileMerger()
+    for pdffile in pdffiles:
+        merger.append(pdffile)
+    merger.write(outfile)
+    merger.close()
+
+
 if __name__ == "__main__":
+    workers = 1
     if sys.argv[1] == '-o':
         sys.argv.pop(1)
         pdffile = sys.argv.pop(1)
+        # Rendering straight to a file, no need for a GUI backend
+        cplot.headless()
+        if sys.argv[1] == '-j':
+            sys.argv.pop(1)
+            workers = int(sys.argv.pop(1))
     else:
         pdffile = None
     picklefile = sys.argv[1]
@@ -138,13 +216,6 @@ if __name__ == "__main__":
             fig = fig_by_type(pds, plottype, dim, fid)
             fig.set_tight_layout(True)
             fig.show()
-        show()
+        plt.show()
     else:
-        pdf = PdfPages(pdffile)
-        for fid in sys.argv[4:]:
-            print 'figure', plottype, dim, fid
-            fig = fig_by_type(pds, plottype, dim, fid)
-            fig.set_size_inches((11.692, 8.267)) # A4 landscape
-            fig.set_tight_layout(True)
-            pdf.savefig(fig)
-        pdf.close()
+        plot_pdf(pds, plottype, dim, sys.argv[4:], pdffile, workers)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Generate a whole report - a set of plots and tables - from a single
+load of the portfolio data, so that all the derived data (best, oracle,
+detEvals etc.) are computed only once for all of them.
+
+Usage: report.py [-j WORKERS] PICKLEFILE SPECFILE OUTDIR
+
+SPECFILE lists the plots and tables to generate, one line each:
+
+    plot PLOTTYPE[,PLOTTYPE...] DIM[,DIM...] FID...
+    table VALTYPE[,VALTYPE...] DIM[,DIM...] FID...
+
+For each combination of the listed types and dimensions, a file is
+produced in OUTDIR: plot_PLOTTYPE_DIMd_FIDS.pdf with a page per FID
+(like plot_conv.py -o), or table_VALTYPE_DIMd_FIDS.tex with a column
+per FID (like table_final.py), FIDS being the FIDs joined by dashes
+(characters other than letters, digits and dashes in the names are
+replaced by underscores).  FIDs may be the symbolic names understood
+by these scripts.  Empty lines and lines starting with # are ignored;
+artifacts that would be written to the same file are rejected.
+Example:
+
+    plot overview 5,20 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 21 22 23 24
+    plot rank_by_budget 5,20 all single many
+    table rank,slowdown2oracle@ 5,20 all volatile all-volatile
+
+With -j, plot pages are rendered by WORKERS processes in parallel.
+"""
+
+import os
+import re
+import string
+import sys
+import time
+
+# Add the path to bbob_pproc and cocopf
+if __name__ == "__main__":
+    (filepath, filename) = os.path.split(sys.argv[0])
+    sys.path.append(os.path.join(filepath, os.path.pardir, os.path.pardir))
+
+import numpy as np
+
+import cocopf.pplot as cplot
+from cocopf.pproc import PortfolioDataSets
+
+# Rendering straight to files, no need for a GUI backend
+cplot.headless()
+
+from plot_conv import plot_pdf
+from table_final import table_final
+
+
+def read_spec(specfile):
+    """
+    Return a list of (kind, type, dim, fids) artifact tuples.
+    """
+    artifacts = []
+    filenames = set()
+    with open(specfile) as f:
+        for line in f:
+            words = line.split()
+            if not words or words[0].startswith('#'):
+                continue
+            (kind, types, dims, fids) = (words[0], words[1], words[2], words[3:])
+            if kind not in ['plot', 'table']:
+                raise ValueError('spec ' + line)
+            for t in string.split(types, ','):
+                for dim in string.split(dims, ','):
+                    filename = artifact_filename(kind, t, int(dim), fids)
+                    if filename in filenames:
+                        raise ValueError('duplicate spec %s: %s' % (filename, line.strip()))
+                    filenames.add(filename)
+                    artifacts.append((kind, t, int(dim), fids))
+    return artifacts
+
+def artifact_filename(kind, t, dim, fids):
+    name = re.sub(r'[^\w-]', '_', '%s_%dd_%s' % (t, dim, string.join(fids, '-')))
+    if kind == 'plot':
+        return 'plot_%s.pdf' % name
+    else:
+        return 'table_%s.tex' % name
+
+
+if __name__ == "__main__":
+    workers = 1
+    if sys.argv[1] == '-j':
+        sys.argv.pop(1)
+        workers = int(sys.argv.pop(1))
+    picklefile = sys.argv[1]
+    specfile = sys.argv[2]
+    outdir = sys.argv[3]
+
+    artifacts = read_spec(specfile)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    t0 = time.time()
+    pds = PortfolioDataSets(pickleFile=picklefile)
+    print 'loaded in %.1fs' % (time.time() - t0)
+
+    np.seterr(under="ignore")
+
+    timings = []
+    for (kind, t, dim, fids) in artifacts:
+        outfile = os.path.join(outdir, artifact_filename(kind, t, dim, fids))
+        t1 = time.time()
+        if kind == 'plot':
+            plot_pdf(pds, t, dim, fids, outfile, workers)
+        else:
+            with open(outfile, 'w') as f:
+                table_final(pds, t, dim, fids, f)
+        timings.append((outfile, time.time() - t1))
+        print '%s: %.1fs' % timings[-1]
+
+    print
+    for (outfile, t) in timings:
+        print '%6.1fs  %s' % (t, outfile)
+    print '%6.1fs  total' % (time.time() - t0)
@@ -22,16 +22,14 @@ import os
 import re
 import sys
 import time
-from pylab import *
+import numpy as np
 
 # Add the path to bbob_pproc and cocopf
 if __name__ == "__main__":
     (filepath, filename) = os.path.split(sys.argv[0])
     sys.path.append(os.path.join(filepath, os.path.pardir, os.path.pardir))
 
-from cocopf.pproc import PortfolioDataSets, resolve_fid
-import cocopf.pplot as cplot
-import bbob_pproc.readalign as ra
+from cocopf.pproc import PortfolioDataSets, resolve_fid, det_evals, det_evals_batch
 
 
 def get_stratds(pds, strat, dim, fid):
@@ -40,7 +38,7 @@ def get_stratds(pds, strat, dim, fid):
     elif strat == 'envelope':
         return pds.bestalg((dim, fid))
     else:
-        return pds.stratds[strat].dictByDimFunc()[dim][fid][0]
+        return pds.strat_dimfunc(strat, (dim, fid))
 
 def _pds_table_iterator(pds, dim, funcId):
     i = 0
@@ -63,15 +61,17 @@ def val_slowdown(pds, baseline_name, dim=None, funcId=None, groupby=None):
     for fid in funcId:
         print 'fid:' + str(fid)
         baseline_ds = get_stratds(pds, baseline_name, dim, fid)
-        baseline_conv_fevs = groupby(baseline_ds.detEvals([10**-8]))
+        baseline_conv_fevs = groupby(det_evals(baseline_ds, [10**-8]))
         baseline_conv_lfevs = np.log(baseline_conv_fevs) / np.log(pfsize)
 
         if not np.isnan(baseline_conv_fevs):
             baseline_solved += 1
 
         i = 0
-        for (kind, name, ds) in _pds_table_iterator(pds, dim, fid):
-            conv_fevs = groupby(ds.detEvals([10**-8]))
+        rows = list(_pds_table_iterator(pds, dim, fid))
+        allevals = det_evals_batch([ds for (kind, name, ds) in rows], [10**-8])
+        for ((kind, name, ds), evals) in zip(rows, allevals):
+            conv_fevs = groupby(evals)
             if np.isnan(baseline_conv_fevs) or np.isnan(conv_fevs):
                 print name + ' \infty'
                 continue
@@ -99,11 +99,7 @@ def val_rank(pds, dim=None, funcId=None, groupby=None):
         # _pds_plot_iterator[] uses funcId only for things we don't care for
         fakeFuncId = funcId[0]
 
-        manyranking = np.array([pds.ranking((dim, i), groupby) for i in funcId])
-        rankcount = np.shape(manyranking[0])[1] - 1
-        amanyranking = ra.alignArrayData(ra.VArrayMultiReader(manyranking))
-        budget = amanyranking[:,0]
-        rankings = np.hsplit(amanyranking[:,1:], len(funcId))
+        (budget, rankings) = pds.ranking_batch(dim, funcId, groupby)
         avgranking = np.average(rankings, axis=0)
         ranking = np.vstack([budget, avgranking.T]).T
 
@@ -135,22 +131,20 @@ def val_by_type(pds, valtype, dim, fid):
     raise ValueError('valtype ' + valtype)
 
 
-if __name__ == "__main__":
-    picklefile = sys.argv[1]
-    valtype = sys.argv[2]
-    dim = int(sys.argv[3])
-
+def table_final(pds, valtype, dim, fids, out=sys.stdout):
+    """
+    Print the TeX table of the given valtype values (possibly with
+    the trailing @) for the given list of fids to ``out``.
+    """
     if valtype.endswith('@'):
         valtype = valtype[0:-1]
         showStat = True
     else:
         showStat = False
 
-    pds = PortfolioDataSets(pickleFile=picklefile)
-
     names = [name for (kind, name, ds) in _pds_table_iterator(pds, dim, 1)]
 
-    values = np.array([val_by_type(pds, valtype, dim, fid) for fid in sys.argv[4:]])
+    values = np.array([val_by_type(pds, valtype, dim, fid) for fid in fids])
     print names
     print values
 
@@ -163,11 +157,20 @@ if __name__ == "__main__":
         else:
             return '%.1f | %.3f' % (v[0], v[3])
 
-    print ' & '.join(['Solver'] + sys.argv[4:]) + ' \\\\'
+    print >>out, ' & '.join(['Solver'] + fids) + ' \\\\'
     for i in range(len(names)):
-        print ' & '.join([names[i]] + [printval(v) for v in values[:,i]]) + ' \\\\'
+        print >>out, ' & '.join([names[i]] + [printval(v) for v in values[:,i]]) + ' \\\\'
 
     #print ' & '.join(['Functions'] + names) + ' \\\\'
-    #for fid in sys.argv[4:]:
+    #for fid in fids:
     #    values = val_by_type(pds, valtype, dim, fid)
     #    print '&'.join([fid] + [str(i) for i in values) + ' \\\\'
+
+
+if __name__ == "__main__":
+    picklefile = sys.argv[1]
+    valtype = sys.argv[2]
+    dim = int(sys.argv[3])
+
+    pds = PortfolioDataSets(pickleFile=picklefile)
+    table_final(pds, valtype, dim, sys.argv[4:])
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.append('.')
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+
+try:
+    from cocopf.methods import _parse_flush
+except ImportError:
+    _parse_flush = None
+
+
+@unittest.skipIf(_parse_flush is None, 'missing dependencies')
+class ParseFlushTest(unittest.TestCase):
+    def test_records(self):
+        self.assertEqual(_parse_flush('1000'), (1000, None))
+
+    def test_secs(self):
+        self.assertEqual(_parse_flush('10s'), (None, 10.))
+
+    def test_both(self):
+        self.assertEqual(_parse_flush('1000,10s'), (1000, 10.))
+        self.assertEqual(_parse_flush('2.5s,1000'), (1000, 2.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.append('.')
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+
+try:
+    import numpy as np
+    import scipy.optimize as so
+    from cocopf.minstep import MinimizeStepping, minimize_stepping, thread_pool_stats
+except ImportError:
+    np = None
+
+
+class SimplexMethod(object):
+    """
+    A minimal stand-in for MinimizeMethod.
+    """
+    name = 'Nelder-Mead'
+    stepping = 'thread'
+
+    def __call__(self, fun, x0, inner_cb=None, outer_cb=None):
+        return so.minimize(fun, x0, method='Nelder-Mead', callback=inner_cb,
+                           options=dict(maxiter=20))
+
+
+def sphere(x):
+    return np.sum(np.square(x))
+
+
+@unittest.skipIf(np is None, 'missing dependencies')
+class MinimizeSteppingTest(unittest.TestCase):
+    def test_finished(self):
+        ms = MinimizeStepping(sphere, np.ones(2), SimplexMethod())
+        with self.assertRaises(StopIteration):
+            for i in range(100):
+                ms.next()
+        self.assertIsNone(ms.thread)
+        # The thread may be serving another minimization by now
+        other = MinimizeStepping(sphere, np.ones(2), SimplexMethod())
+        with self.assertRaises(StopIteration):
+            ms.next()
+        ms.stop()
+        other.next()
+        other.stop()
+
+    def test_stopped(self):
+        ms = MinimizeStepping(sphere, np.ones(2), SimplexMethod())
+        ms.next()
+        ms.stop()
+        self.assertIsNone(ms.thread)
+        parked = thread_pool_stats()['parked']
+        ms.stop()
+        with self.assertRaises(StopIteration):
+            ms.next()
+        self.assertEqual(thread_pool_stats()['parked'], parked)
+
+    def test_auto(self):
+        mm = SimplexMethod()
+        mm.stepping = 'auto'
+        ms = minimize_stepping(sphere, np.ones(2), mm)
+        self.assertIsInstance(ms, MinimizeStepping)
+        ms.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Run from the directory with fgeneric.py and bbobbenchmarks.py, e.g.:
+#   python -m unittest discover -s cocopf/tests -t .
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append('.')
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+
+try:
+    import numpy as np
+    import fgeneric
+    import bbobbenchmarks
+    from cocopf.experiment import FInstance
+    from cocopf.methods import MinimizeMethod
+    from cocopf.population import ParallelPopulation, futures
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None or futures is None, 'missing dependencies')
+class ParallelPopulationTest(unittest.TestCase):
+    def setUp(self):
+        self.datapath = tempfile.mkdtemp(prefix='cocopf-test')
+        self.f = fgeneric.LoggingFunction(datapath=self.datapath, algid='test', comments='')
+        self.f.setfun(*bbobbenchmarks.instantiate(1, iinstance=1))
+        self.fi = FInstance(self.f, 2, 1, 1, 1000)
+
+    def tearDown(self):
+        self.f.finalizerun()
+        shutil.rmtree(self.datapath)
+
+    def test_step_in_worker(self):
+        """
+        Steps are done in a forked worker and their evaluations
+        are accounted for by our logging function.
+        """
+        self.fi.f.evalfun(np.zeros(2)) # the workers are told about budget use
+        pop = ParallelPopulation(self.fi, 2, [MinimizeMethod('Nelder-Mead', self.fi)], workers=1)
+        try:
+            evals0 = self.f.evaluations
+            (x, y) = pop.step_one(0)
+            self.assertEqual(y, self.fi.evalfun(x))
+            self.assertGreater(self.f.evaluations, evals0)
+            self.assertEqual(pop.iters[0], 1)
+        finally:
+            pop.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.append('.')
+sys.path.append(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+
+try:
+    import numpy as np
+    import scipy.stats as ss
+    from cocopf.pproc import PortfolioDataSets, rankdata, _rank_converging
+except ImportError:
+    np = None
+
+
+def _rank_converging_loop(values, ftarget):
+    """
+    The original per-dimfun ranking of PortfolioDataSets.ranking().
+    """
+    (nbudgets, count) = np.shape(values)
+    values = values.copy()
+    firstconv = np.ones(count, dtype=int) * (nbudgets+1)
+    for i in range(count):
+        try:
+            firstconv[i] = np.nonzero(values[:,i] == ftarget)[0][0]
+        except IndexError:
+            continue
+    firstconvranks = ss.mstats.rankdata(firstconv)
+    for i in range(count):
+        r = firstconvranks[i]
+        values[firstconv[i]:, i] = ftarget - (1-r/count)*ftarget
+    return np.array([ss.mstats.rankdata(row) for row in values])
+
+
+@unittest.skipIf(np is None, 'missing dependencies')
+class RankTest(unittest.TestCase):
+    def test_rankdata(self):
+        a = np.array([[3, 1, np.nan, 1, 2, np.nan], [5, 5, 5, np.nan, 0, 1]])
+        np.testing.assert_array_equal(rankdata(a),
+                [[4, 1.5, 5, 1.5, 3, 6], [4, 4, 4, 6, 1, 2]])
+        for row in a:
+            np.testing.assert_array_equal(rankdata(row), ss.mstats.rankdata(row))
+
+    def test_rank_converging(self):
+        ftarget = 1e-8
+        nr = np.random.RandomState(0)
+        for k in range(20):
+            values = nr.randint(1, 4, size=(30, 5)).astype(float)
+            values[nr.rand(30, 5) < 0.2] = ftarget
+            values[nr.rand(30, 5) < 0.1] = np.nan
+            np.testing.assert_array_equal(_rank_converging(values, ftarget),
+                                          _rank_converging_loop(values, ftarget))
+
+    def test_rank_converging_batch(self):
+        ftarget = 1e-8
+        values = np.random.rand(3, 10, 4)
+        values[values < 0.3] = ftarget
+        ranks = _rank_converging(values, ftarget)
+        for i in range(3):
+            np.testing.assert_array_equal(ranks[i], _rank_converging(values[i], ftarget))
+
+
+class FakeDataSet(object):
+    def __init__(self, evals):
+        self.evals = evals
+        self.maxevals = np.array([1000.])
+        self.bestfinalfunvals = np.array([1e-8])
+
+    def detEvals(self, targets):
+        return [np.array([self.evals])]
+
+
+class FakeDataSetList(object):
+    def __init__(self, datasets):
+        self.datasets = datasets
+
+    def dictByDimFunc(self):
+        dbdf = dict()
+        for ((dim, funcId), ds) in self.datasets.iteritems():
+            dbdf.setdefault(dim, dict())[funcId] = [ds]
+        return dbdf
+
+
+@unittest.skipIf(np is None, 'missing dependencies')
+class OracleTest(unittest.TestCase):
+    def test_oracle_table_missing(self):
+        algds = dict(a=FakeDataSetList({(5, 1): FakeDataSet(100.), (5, 2): FakeDataSet(10.)}),
+                     b=FakeDataSetList({(5, 1): FakeDataSet(50.)}))
+        pds = PortfolioDataSets(algorithms=algds, strategies=dict())
+        pds._bestalg = {(5, 1): FakeDataSet(50.), (5, 2): FakeDataSet(10.)}
+        table = pds.oracle_table()
+        self.assertEqual(table.keys(), [(5, 1)])
+        self.assertEqual(table[(5, 1)][0], 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()